@@ -1,9 +1,22 @@
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from math import floor, inf
 from os import path
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.webdriver import WebDriver
-from threading import Timer
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from threading import Event, Thread
+from urllib.parse import urljoin
+import json
+import re
+import requests
 import time
 
 # University course registration system automation
@@ -30,9 +43,54 @@ start_minute = 30
 
 name = 'YOUR_STUDENT_ID'
 
+# Explicit wait configuration (seconds)
+wait_timeout = 10
+alert_timeout = 2
+row_timeout = 5  # the old implicit wait; the server is slow at peak load
+poll_interval = 0.01
+
+# How long each step actually took (seconds)
+step_times = {}
+
+# Server clock calibration
+calib_samples = 8
+spin_secs = 0.005  # busy-wait the last few ms instead of sleeping
+clock_offset = 0.0  # server clock - local clock (seconds)
+clock_rtt = 0.0
+
+# HTTP fast path: post the ASP.NET form directly, Selenium stays as fallback
+grab_mode = 'http'  # 'http' or 'selenium'
+http_pool_size = 8
+http_timeout = 5
+alert_re = re.compile(r"alert\(\s*(['\"])(.*?)\1\s*\)")
+row_payloads = {}  # grid row index (as in the XPath) -> postback form data
+
+# Submit every wishlist row at once at T-0 (HTTP mode only)
+concurrent_grab = True
+retry_secs = 60  # how long the first row keeps retrying in concurrent mode, or waiting for row 2 in Selenium mode
+retry_backoff = (0.05, 1.0)  # other rows wait this long between posts before T-0, doubling up to the max
+post_latencies = []  # seconds per add postback
+
+# Keep the headless browser from the test run alive until the grab
+reuse_driver = True
+headless = True
+keepalive_secs = 60
+driver = None
+keepalive_thread = None
+keepalive_stop = Event()
+row_cache = {}  # grid row index -> add button element, resolved after pre-sort
+
+# Monotonic timestamps of every find / click / alert / accept (and HTTP post / response)
+trace = []
+trace_path = 'trace.json'
+
 def main() -> None:
     input_passwd()
-    test_login()
+    # Add row 2 once as the test: over HTTP if that is the grab path
+    test_login(add=grab_mode != 'http')
+    if grab_mode == 'http':
+        http_test_login()
+    calibrate_clock()
 
     a_ready_login = alarm()
     a_ready_login.do(ready_login, start_hour, start_minute - 5)
@@ -41,46 +99,167 @@ def input_passwd() -> None:
     global passwd
     passwd = input('input your passwd: ')
 
-def test_login() -> None:
+def test_login(add = True) -> None:
     create_driver()
-    driver.get(url)
-    time.sleep(0.5)
+    fresh_login()
 
-    login(driver)
-    time.sleep(0.5)
-
-    driver.find_element(By.ID, pre_sort_btn).click()
-    time.sleep(0.5)
+    if add:
+        row_button(2).click()
+        alert_accept()
 
-    driver.find_element(By.XPATH, start_add_btn + str(2) + end_add_btn).click()
-    alert_accept()
-    time.sleep(0.5)
+    if reuse_driver:
+        start_keepalive()
+    else:
+        driver.find_element(By.ID, logout_btn).click()
+        driver.quit()
 
-    driver.find_element(By.ID, logout_btn).click()
-    driver.quit()
+    print_step_times()
 
 def ready_login() -> None:
     """Login and prepare for grabbing at T-1 minute"""
-    create_driver()
-    driver.get(url)
-    time.sleep(0.5)
+    if grab_mode == 'http':
+        # A keepalive re-login from here on could invalidate the HTTP session
+        stop_keepalive()
+        try:
+            http_ready_login()
+        except (requests.RequestException, KeyError) as e:
+            print(f'HTTP 模式準備失敗，改用 Selenium: {e!r}')
+            row_payloads.clear()
+    if row_payloads:
+        a_warm_pool = alarm()
+        a_warm_pool.do(warm_pool, start_hour, start_minute - 1, 58)
+    else:
+        selenium_ready()
+    calibrate_clock()
+
+    # Schedule grab so the first click reaches the server at T-0
+    a_grab_lesson = alarm()
+    a_grab_lesson.do(grab_courses, start_hour, start_minute, lead=clock_rtt / 2)
+
+def selenium_ready() -> None:
+    """Logged in with the rows pre-sorted, reusing the running browser if possible"""
+    stop_keepalive()
+    browser_ok = reuse_driver and driver is not None
+    alive = False
+    if browser_ok:
+        try:
+            alive = session_alive()
+        except WebDriverException:
+            browser_ok = False  # the browser itself is gone
 
+    if alive:
+        pre_sort()
+    elif browser_ok:
+        print('登入已過期，重新登入')
+        fresh_login()
+    else:
+        create_driver()
+        fresh_login()
+    cache_rows()
+    print_step_times()
+
+def fresh_login() -> None:
+    open_page()
     login(driver)
-    time.sleep(0.5)
+    pre_sort()
 
-    driver.find_element(By.ID, pre_sort_btn).click()
-    time.sleep(0.5)
+def session_alive() -> bool:
+    """Fetch the page in the background (the DOM is left alone) and check we are still logged in"""
+    html = driver.execute_async_script(
+        'const done = arguments[arguments.length - 1];'
+        "fetch(arguments[0], {credentials: 'same-origin'}).then(r => r.text()).then(done, () => done(''));",
+        url,
+    )
+    return bool(html) and html.find(name_input) == -1
 
-    # Schedule grab at T-1 second for precise timing
-    a_grab_lesson = alarm()
-    a_grab_lesson.do(grab_lesson, start_hour, start_minute - 1, 59)
+def keepalive() -> None:
+    """Light refresh every keepalive_secs so the login does not expire"""
+    while not keepalive_stop.wait(keepalive_secs):
+        try:
+            if not session_alive():
+                print('登入已過期，重新登入')
+                fresh_login()
+        except WebDriverException as e:
+            print(f'keepalive 失敗: {e!r}')
+
+def start_keepalive() -> None:
+    global keepalive_thread
+    keepalive_stop.clear()
+    keepalive_thread = Thread(target=keepalive, daemon=True)
+    keepalive_thread.start()
+
+def stop_keepalive() -> None:
+    """Stop before using the driver ourselves, WebDriver is not thread-safe"""
+    if keepalive_thread is not None:
+        keepalive_stop.set()
+        keepalive_thread.join()
+
+def cache_rows() -> None:
+    """Resolve every row's add button in one round trip after pre-sort"""
+    cells = driver.execute_script(
+        "return Array.from(document.querySelectorAll('#ContentPlaceHolder1_grd_subjs > tbody > tr'))"
+        ".map(tr => tr.querySelector(':scope > td'));"
+    )
+    row_cache.clear()
+    row_cache.update({i: cell for i, cell in enumerate(cells, 1) if cell is not None})
+
+def click_row(i) -> None:
+    """Click row i, using the handle cached after pre-sort while it is still attached"""
+    cell = row_cache.pop(i, None)
+    row_cache.clear()  # the click posts back, so every cached handle goes stale
+    if cell is not None:
+        mark('find', row=i, cached=True)
+        try:
+            cell.click()
+            mark('click', row=i)
+            return
+        except StaleElementReferenceException:
+            pass
+    button = row_button(i)
+    mark('find', row=i)
+    button.click()
+    mark('click', row=i)
+
+def grab_courses() -> None:
+    """HTTP fast path if it is prepared, Selenium otherwise"""
+    mark('fire')
+    try:
+        http_or_selenium_grab()
+    finally:
+        save_trace()
+
+def http_or_selenium_grab() -> None:
+    if row_payloads:
+        try:
+            if concurrent_grab:
+                http_grab_concurrent()
+            else:
+                http_grab_lesson()
+            if driver is not None:
+                stop_keepalive()
+                driver.quit()
+            return
+        except requests.RequestException as e:
+            print(f'HTTP 模式失敗，改用 Selenium: {e!r}')
+            selenium_ready()
+    grab_lesson()
 
 def grab_lesson() -> None:
     """Click all pre-sorted courses as fast as possible"""
     i = 2  # Start from row 2 (row 1 is header)
     # Keep clicking row 2 until success (other students may grab first)
+    deadline = time.monotonic() + retry_secs
     while True:
-        driver.find_element(By.XPATH, start_add_btn + str(i) + end_add_btn).click()
+        try:
+            click_row(i)
+        except StaleElementReferenceException:
+            continue
+        except TimeoutException:
+            # Slow postback, or the row is gone (logged out, error page, empty wishlist)
+            if time.monotonic() > deadline:
+                print(f'{retry_secs} 秒內都找不到第 {i} 列，停止')
+                raise
+            continue
         alert_accept()
         if alert_text.find(grab_success) != -1:
             break
@@ -89,7 +268,7 @@ def grab_lesson() -> None:
     while True:
         i += 1
         try:
-            driver.find_element(By.XPATH, start_add_btn + str(i) + end_add_btn).click()
+            click_row(i)
             alert_accept()
         except:
             break
@@ -99,22 +278,299 @@ def grab_lesson() -> None:
 
     print('程式結束')
 
+def calibrate_clock(target = None, samples = calib_samples):
+    """Estimate server clock offset and RTT from HTTP Date headers
+
+    The server stamped second D somewhere between our send (t0) and receive
+    (t1), so offset = server - local lies in [D - t1, D + 1 - t0]. Intersect
+    these intervals; after the first sample each request is sent so that it
+    arrives when the server clock crosses a second under the current
+    estimate, which roughly halves the interval until it is about one RTT.
+    """
+    global clock_offset, clock_rtt
+    target = target or url
+    session = requests.Session()
+    session.head(target)  # open the keep-alive connection first
+
+    lo, hi = -inf, inf
+    rtt = inf
+    for _ in range(samples):
+        if hi < inf:
+            mid = (lo + hi) / 2
+            send = floor(time.time() + mid) + 1 - mid - rtt / 2
+            if send - time.time() < rtt:
+                send += 1
+            time.sleep(send - time.time())
+
+        t0 = time.time()
+        response = session.head(target)
+        t1 = time.time()
+        server = parsedate_to_datetime(response.headers['Date']).timestamp()
+        rtt = min(rtt, t1 - t0)
+
+        new_lo, new_hi = server - t1, server + 1 - t0
+        if new_lo > hi or new_hi < lo:
+            # Inconsistent with earlier samples (clock stepped?), start over
+            lo, hi = new_lo, new_hi
+        else:
+            lo, hi = max(lo, new_lo), min(hi, new_hi)
+
+    clock_offset, clock_rtt = (lo + hi) / 2, rtt
+    print(f'伺服器時差: {clock_offset * 1000:+.1f} ms (±{(hi - lo) * 500:.1f} ms), RTT: {rtt * 1000:.1f} ms')
+    return clock_offset, clock_rtt
+
 class alarm:
-    """Schedule function execution at specific time"""
-    def do(self, func, start_hour, start_minute, start_second = 0) -> None:
+    """Schedule function execution at specific server time
+
+    Waits on the monotonic clock: sleep until spin_secs before the deadline,
+    then busy-wait. lead fires that many seconds early (e.g. half the RTT so
+    the request reaches the server on time).
+    """
+    def do(self, func, start_hour, start_minute, start_second = 0, lead = 0.0) -> None:
         time_now = datetime.now()
         time_start = time_now.replace(hour=start_hour, minute=start_minute, second=start_second, microsecond=0)
-        time_delta = time_start - time_now
-        time_secs = time_delta.total_seconds()
+        # Local time at which the server clock reads time_start
+        time_secs = time_start.timestamp() - clock_offset - lead - time.time()
 
-        self.timer = Timer(time_secs, func)
-        self.timer.start()
+        self.deadline = time.monotonic() + time_secs
+        self.thread = Thread(target=self.run, args=(func,))
+        self.thread.start()
+
+    def run(self, func) -> None:
+        remaining = self.deadline - time.monotonic()
+        if remaining > spin_secs:
+            time.sleep(remaining - spin_secs)
+        while time.monotonic() < self.deadline:
+            pass
+        self.fired = time.monotonic()
+        func()
+
+def mark(event, **info) -> float:
+    """Append a monotonic timestamp to the trace and return it"""
+    t = time.monotonic()
+    trace.append({'event': event, 't': t, **info})
+    return t
+
+def save_trace(path = None) -> None:
+    """Write the trace as JSON, times in ms since the first event"""
+    t0 = trace[0]['t'] if trace else 0
+    events = [{**e, 't': round((e['t'] - t0) * 1000, 3)} for e in trace]
+    with open(path or trace_path, 'w', encoding='utf-8') as f:
+        json.dump({'grab_mode': grab_mode, 'concurrent_grab': concurrent_grab, 'events': events}, f, ensure_ascii=False, indent=1)
+
+def wait_for(step, condition, timeout = wait_timeout):
+    """Wait until condition holds and record how long it took"""
+    start = time.monotonic()
+    result = WebDriverWait(
+        driver, timeout, poll_frequency=poll_interval,
+        ignored_exceptions=[StaleElementReferenceException],
+    ).until(condition)
+    step_times[step] = time.monotonic() - start
+    return result
+
+def print_step_times() -> None:
+    for step, secs in step_times.items():
+        print(f'{step}: {secs * 1000:.0f} ms')
+
+def open_page() -> None:
+    start = time.monotonic()
+    driver.get(url)
+    step_times['get'] = time.monotonic() - start
+    wait_for('load', EC.element_to_be_clickable((By.ID, name_input)))
+
+def pre_sort() -> None:
+    """Click pre-sort and wait until the new page's wishlist rows are clickable"""
+    button = wait_for('pre_sort_ready', EC.element_to_be_clickable((By.ID, pre_sort_btn)))
+    button.click()
+    wait_for('pre_sort', EC.staleness_of(button))
+    wait_for('rows', EC.element_to_be_clickable((By.XPATH, start_add_btn + str(2) + end_add_btn)))
+
+def row_button(i):
+    return wait_for('row', EC.element_to_be_clickable((By.XPATH, start_add_btn + str(i) + end_add_btn)), row_timeout)
+
+class FormParser(HTMLParser):
+    """Hidden fields, id -> name/value of inputs, links and each grid row's add button"""
+    def __init__(self, page_url):
+        super().__init__()
+        self.url = page_url
+        self.action = page_url
+        self.hidden = {}
+        self.names = {}
+        self.values = {}
+        self.links = {}
+        self.rows = []  # postback fields of the button in each row's first cell
+        self.in_grid = False
+        self.cell = 0
+
+    def handle_starttag(self, tag, attrs) -> None:
+        attrs = dict(attrs)
+        if tag == 'form':
+            self.action = urljoin(self.url, attrs.get('action') or '')
+        elif tag == 'input':
+            if attrs.get('type') == 'hidden':
+                self.hidden[attrs.get('name')] = attrs.get('value', '')
+            if 'id' in attrs:
+                self.names[attrs['id']] = attrs.get('name')
+                self.values[attrs['id']] = attrs.get('value', '')
+        elif tag == 'a' and 'id' in attrs:
+            self.links[attrs['id']] = attrs.get('href')
+
+        if tag == 'table' and attrs.get('id') == 'ContentPlaceHolder1_grd_subjs':
+            self.in_grid = True
+        elif self.in_grid and tag == 'tr':
+            self.rows.append(None)
+            self.cell = 0
+        elif self.in_grid and tag in ('td', 'th'):
+            self.cell += 1
+        elif self.in_grid and self.cell == 1 and self.rows[-1] is None:
+            if tag == 'input' and attrs.get('name'):
+                self.rows[-1] = {attrs['name']: attrs.get('value', '')}
+            elif tag == 'a' and (m := re.search(r"__doPostBack\('([^']*)','([^']*)'\)", attrs.get('href', ''))):
+                self.rows[-1] = {'__EVENTTARGET': m.group(1), '__EVENTARGUMENT': m.group(2)}
+
+    def handle_endtag(self, tag) -> None:
+        if tag == 'table':
+            self.in_grid = False
+
+def parse_page(response) -> FormParser:
+    """Parse the page and record its alert text like alert_accept does"""
+    global alert_text
+    response.raise_for_status()
+    page = FormParser(response.url)
+    page.feed(response.text)
+    page.alert = '\n'.join(m.group(2) for m in alert_re.finditer(response.text))
+    alert_text = page.alert
+    if page.alert:
+        print(page.alert)
+    return page
+
+def create_session() -> None:
+    global session
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=http_pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+def postback(page, button, inputs = None) -> FormParser:
+    """Submit the page's form as if the button with this element id was clicked"""
+    data = dict(page.hidden)
+    data.update({page.names[i]: value for i, value in (inputs or {}).items()})
+    data[page.names[button]] = page.values[button]
+    return parse_page(session.post(page.action, data=data, timeout=http_timeout))
+
+def http_ready_login() -> None:
+    """Login and pre-sort over plain HTTP, then pre-build every row's postback"""
+    global post_url, logout_url
+    create_session()
+    page = parse_page(session.get(url, timeout=http_timeout))
+    page = postback(page, login_btn, {name_input: name, passwd_input: passwd})
+    if alert_text.find(login_error) != -1:
+        print('登入失敗')
+        exit(1)
+    page = postback(page, pre_sort_btn)
+
+    post_url = page.action
+    logout_url = urljoin(page.url, page.links[logout_btn])
+    row_payloads.clear()
+    for i, fields in enumerate(page.rows, 1):
+        if fields:
+            row_payloads[i] = {**page.hidden, **fields}
+    print(f'HTTP 模式就緒：{len(row_payloads)} 門課')
+
+def warm_pool() -> None:
+    """Open one keep-alive connection per row in case the server dropped them while idle"""
+    with ThreadPoolExecutor(max_workers=pool_workers()) as pool:
+        list(pool.map(lambda _: session.head(post_url, timeout=http_timeout), range(pool_workers())))
+
+def pool_workers() -> int:
+    return max(1, min(len(row_payloads), http_pool_size))
+
+def post_row(i) -> str:
+    """Post one row's pre-built payload, return its alert text"""
+    start = mark('post', row=i)
+    page = parse_page(session.post(post_url, data=row_payloads[i], timeout=http_timeout))
+    post_latencies.append(mark('response', row=i, text=page.alert) - start)
+    return page.alert
+
+def http_test_login() -> None:
+    http_ready_login()
+    post_row(min(row_payloads))
+    session.get(logout_url, timeout=http_timeout)
+
+def http_grab_lesson() -> None:
+    """Post the pre-built row payloads over the warm connection pool"""
+    rows = sorted(row_payloads)  # rows[0] is row 2, the first wishlist course
+    # Keep posting it until success (other students may grab first)
+    while True:
+        post_row(rows[0])
+        if alert_text.find(grab_success) != -1:
+            break
+
+    for i in rows[1:]:
+        post_row(i)
+
+    session.get(logout_url, timeout=http_timeout)
+    print('程式結束')
+
+def grab_row(i, retry, opened, failed) -> list:
+    """Post one row until success, for at most retry_secs
+
+    Without retry a failure only counts once registration is known to be
+    open (some row has succeeded), so a post that arrived a little before
+    T-0 is sent again after a backoff. Those rows give up as soon as the
+    retrying row sets failed.
+    """
+    alerts = []
+    deadline = time.monotonic() + retry_secs
+    delay, max_delay = retry_backoff
+    while True:
+        was_open = opened.is_set()
+        alerts.append(post_row(i))
+        if alerts[-1].find(grab_success) != -1:
+            opened.set()
+            return alerts
+        if time.monotonic() > deadline:
+            if retry:
+                failed.set()
+            return alerts
+        if not retry:
+            if was_open or failed.wait(delay):
+                return alerts
+            delay = min(delay * 2, max_delay)
+
+def http_grab_concurrent() -> dict:
+    """Post every row at once, the first wishlist row retries on its own
+
+    Returns the alert texts of each row (grid row index -> list of alerts).
+    """
+    rows = sorted(row_payloads)
+    opened, failed = Event(), Event()
+    with ThreadPoolExecutor(max_workers=len(rows)) as pool:
+        futures = {i: pool.submit(grab_row, i, i == rows[0], opened, failed) for i in rows}
+        results = {i: future.result() for i, future in futures.items()}
+
+    for i, alerts in results.items():
+        retries = f'（重試 {len(alerts) - 1} 次）' if len(alerts) > 1 else ''
+        print(f'第 {i} 列: {alerts[-1]}{retries}')
+
+    session.get(logout_url, timeout=http_timeout)
+    print('程式結束')
+    return results
 
 def login(driver) -> None:
     driver.find_element(By.ID, name_input).send_keys(name)
     driver.find_element(By.ID, passwd_input).send_keys(passwd)
-    driver.find_element(By.ID, login_btn).click()
-    alert_accept()
+    button = driver.find_element(By.ID, login_btn)
+    mark('find', step='login')
+    button.click()
+    mark('click', step='login')
+    # Either an alert (wrong password) or the logged-in page shows up
+    wait_for('login', EC.any_of(
+        EC.alert_is_present(),
+        EC.element_to_be_clickable((By.ID, pre_sort_btn)),
+    ))
+    mark('page', step='login')
+    alert_accept(0)
     if alert_text.find(login_error) != -1:
         driver.quit()
         print('登入失敗')
@@ -123,16 +579,24 @@ def login(driver) -> None:
 def create_driver() -> None:
     global driver
     service = Service(log_path=path.devnull)
-    driver = WebDriver(service=service)
-    driver.implicitly_wait(5)
+    options = Options()
+    if headless:
+        options.add_argument('-headless')
+    driver = WebDriver(service=service, options=options)
+    # Only explicit waits, so a missing element fails immediately
+    driver.implicitly_wait(0)
 
-def alert_accept() -> None:
+def alert_accept(timeout = alert_timeout) -> None:
     global alert_text
     try:
+        if timeout:
+            wait_for('alert', EC.alert_is_present(), timeout)
         alert = driver.switch_to.alert
         alert_text = alert.text
+        mark('alert', text=alert_text)
         print(alert_text)
         alert.accept()
+        mark('accept')
     except:
         alert_text = ''
 
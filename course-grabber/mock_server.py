@@ -0,0 +1,364 @@
+from collections import defaultdict
+from datetime import datetime
+from html import escape
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import floor
+from selenium.common.exceptions import WebDriverException
+from statistics import mean
+from threading import Lock, Thread
+from urllib.parse import parse_qs
+import argparse
+import requests
+import secrets
+import time
+
+import grabber
+
+# Local stand-in for the registration server, used to check the grabber offline
+prefix = 'ctl00$ContentPlaceHolder1$'
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real server
+    disable_nagle_algorithm = True  # otherwise delayed ACKs add ~40 ms per request
+
+    def date_time_string(self, timestamp = None) -> str:
+        """Date header from the server's (skewed) clock"""
+        return super().date_time_string(self.server.now())
+
+    def do_HEAD(self) -> None:
+        self.respond(lambda: b'', head=True)
+
+    def do_GET(self) -> None:
+        self.respond(self.get_page)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode(), keep_blank_values=True).items()}
+        self.respond(lambda: self.post_page(form))
+
+    def respond(self, build, head = False) -> None:
+        """Half the latency before the server handles the request, half after"""
+        time.sleep(self.server.latency / 2)
+        self.server.arrivals.append((self.path, self.server.now()))
+        self.new_session = False
+        body = build()
+        self.send_response(200)
+        time.sleep(self.server.latency / 2)
+        if self.new_session:
+            self.send_header('Set-Cookie', f'ASP.NET_SessionId={self.sid}; path=/')
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    @property
+    def session(self) -> dict:
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        self.new_session = 'ASP.NET_SessionId' not in cookie
+        self.sid = secrets.token_hex(8) if self.new_session else cookie['ASP.NET_SessionId'].value
+        return self.server.sessions.setdefault(self.sid, {'login': False, 'pre_sort': False})
+
+    def get_page(self) -> bytes:
+        session = self.session
+        if self.path.endswith('logout'):
+            session.update(login=False, pre_sort=False)
+        return self.server.render(session)
+
+    def post_page(self, form) -> bytes:
+        session = self.session
+        server = self.server
+        if form.get('__EVENTVALIDATION') != server.validation or '__VIEWSTATE' not in form:
+            return server.render(session, '頁面已過期')
+
+        if prefix + 'BtnLoginNew' in form:
+            ok = form.get(prefix + 'ed_StudNo') and form.get(prefix + 'ed_pass') == server.password
+            session['login'] = bool(ok)
+            return server.render(session, None if ok else grabber.login_error)
+        if not session['login']:
+            return server.render(session, '請重新登入')
+        if prefix + 'Button7' in form:
+            session['pre_sort'] = True
+            return server.render(session)
+
+        for i, course in enumerate(server.wishlist):
+            if prefix + f'grd_subjs$ctl{i + 2:02d}$btnAdd' in form:
+                return server.render(session, server.add(self.sid, course))
+        return server.render(session)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+class MockServer(ThreadingHTTPServer):
+    """skew: server clock - local clock (s), latency: round trip added per request (s)
+
+    Serves a minimal ASP.NET-style subjselect page: login form, pre-sort
+    button and the wishlist grid. Adding a course before open_at (server
+    time) or when it has no seats left answers with an alert like the real page.
+    """
+    daemon_threads = True
+
+    def __init__(self, skew = 0.0, latency = 0.0, port = 0, wishlist = ('CSIE1010', 'CSIE2020', 'MATH1000'), seats = 1, open_at = 0.0, password = 'passwd'):
+        super().__init__(('127.0.0.1', port), MockHandler)
+        self.skew = skew
+        self.latency = latency
+        self.arrivals = []  # (path, server time) of every request
+        self.url = f'http://127.0.0.1:{self.server_port}/AA/CLASS/subjselect/'
+
+        self.wishlist = list(wishlist)
+        self.seats = dict.fromkeys(self.wishlist, seats)
+        self.enrolled = {}  # session id -> courses
+        self.add_requests = 0
+        self.open_at = open_at
+        self.password = password
+        self.sessions = {}
+        self.validation = secrets.token_hex(8)
+        self.lock = Lock()
+
+    def now(self) -> float:
+        return time.time() + self.skew
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def add(self, sid, course) -> str:
+        with self.lock:
+            self.add_requests += 1
+            taken = self.enrolled.setdefault(sid, [])
+            if self.now() < self.open_at:
+                return '尚未開放選課'
+            if course in taken:
+                return '已選過此課程'
+            if self.seats[course] <= 0:
+                return '人數已滿'
+            self.seats[course] -= 1
+            taken.append(course)
+            return f'{course} 加選成功'
+
+    def render(self, session, alert = None) -> bytes:
+        hidden = {
+            '__EVENTTARGET': '',
+            '__EVENTARGUMENT': '',
+            '__VIEWSTATE': secrets.token_urlsafe(24),
+            '__EVENTVALIDATION': self.validation,
+        }
+        html = ['<html><body><form method="post" action="./" id="form1">']
+        html += [f'<input type="hidden" name="{k}" id="{k}" value="{v}">' for k, v in hidden.items()]
+
+        if not session['login']:
+            html += [
+                f'<input type="text" name="{prefix}ed_StudNo" id="ContentPlaceHolder1_ed_StudNo">',
+                f'<input type="password" name="{prefix}ed_pass" id="ContentPlaceHolder1_ed_pass">',
+                f'<input type="submit" name="{prefix}BtnLoginNew" value="登入" id="ContentPlaceHolder1_BtnLoginNew">',
+            ]
+        else:
+            html += [
+                '<a id="ContentPlaceHolder1_HyperLink5" href="logout">登出</a>',
+                f'<input type="submit" name="{prefix}Button7" value="預排" id="ContentPlaceHolder1_Button7">',
+            ]
+        if session['login'] and session['pre_sort']:
+            html.append('<table id="ContentPlaceHolder1_grd_subjs"><tbody><tr><th>加選</th><th>課程</th></tr>')
+            for i, course in enumerate(self.wishlist):
+                html.append(
+                    f'<tr><td><input type="submit" name="{prefix}grd_subjs$ctl{i + 2:02d}$btnAdd" value="加選"'
+                    f' id="ContentPlaceHolder1_grd_subjs_btnAdd_{i}"></td><td>{escape(course)}</td></tr>'
+                )
+            html.append('</tbody></table>')
+
+        html.append('</form>')
+        if alert:
+            html.append(f"<script>alert('{alert}');</script>")
+        html.append('</body></html>')
+        return '\n'.join(html).encode()
+
+def check_clock(skew = 3.7, latency = 0.02, lead_secs = 2):
+    """Calibrate against a skewed server, then fire at a server second
+
+    Returns the offset estimate error and how far from the target second the
+    request actually reached the server (both in ms).
+    """
+    server = MockServer(skew, latency).start()
+    offset, rtt = grabber.calibrate_clock(server.url)
+
+    session = requests.Session()
+    session.head(server.url)
+    target = datetime.fromtimestamp(floor(server.now()) + lead_secs)
+
+    a_fire = grabber.alarm()
+    a_fire.do(lambda: session.head(server.url + 'fire'), target.hour, target.minute, target.second, lead=rtt / 2)
+    a_fire.thread.join()
+    server.shutdown()
+
+    arrival = [t for p, t in server.arrivals if p.endswith('fire')][-1]
+    result = {
+        'offset_error_ms': (offset - skew) * 1000,
+        'arrival_error_ms': (arrival - target.timestamp()) * 1000,
+    }
+    print(f"時差估計誤差: {result['offset_error_ms']:+.1f} ms, 到達誤差: {result['arrival_error_ms']:+.1f} ms")
+    return result
+
+def check_http(latency = 0.02, open_delay = 0.3):
+    """Run the HTTP fast path against the mock page
+
+    Registration opens open_delay seconds after the grab starts, so row 2 is
+    retried until it succeeds. Returns what the mock enrolled and how many
+    add requests were posted.
+    """
+    server = MockServer(latency=latency).start()
+    grabber.url = server.url
+    grabber.name, grabber.passwd = 'test', server.password
+
+    grabber.http_ready_login()
+    grabber.warm_pool()
+    server.open_at = server.now() + open_delay
+    start = time.monotonic()
+    grabber.http_grab_lesson()
+    elapsed = time.monotonic() - start
+    server.shutdown()
+
+    enrolled = [c for taken in server.enrolled.values() for c in taken]
+    print(f'加選: {enrolled}, 送出 {server.add_requests} 次, 耗時 {elapsed * 1000:.0f} ms')
+    return {'enrolled': enrolled, 'posts': server.add_requests, 'elapsed_ms': elapsed * 1000}
+
+def histogram(values_ms, bins = 10, width = 40) -> None:
+    """Text histogram, one line per bin"""
+    lo, hi = min(values_ms), max(values_ms)
+    step = (hi - lo) / bins or 1
+    counts = [0] * bins
+    for v in values_ms:
+        counts[min(int((v - lo) / step), bins - 1)] += 1
+    for b, count in enumerate(counts):
+        bar = '#' * round(count / max(counts) * width)
+        print(f'{lo + b * step:7.1f} - {lo + (b + 1) * step:7.1f} ms | {bar} {count}')
+
+def check_concurrent(latency = 0.02, runs = 20, open_delay = 0.05):
+    """Sequential vs concurrent HTTP grab against fresh mock servers
+
+    Registration opens open_delay seconds after T-0, so early posts are
+    answered with "not open yet" and retried. Prints how long each mode took
+    until every row was done and a histogram of the add postbacks' latency
+    in concurrent mode.
+    """
+    grabber.name = 'test'
+    elapsed = {False: [], True: []}
+    enrolled = {False: 0, True: 0}
+    for concurrent in (False, True):
+        grabber.post_latencies.clear()
+        for _ in range(runs):
+            server = MockServer(latency=latency, wishlist=[f'COURSE{i}' for i in range(1, 7)]).start()
+            grabber.url, grabber.passwd = server.url, server.password
+            grabber.http_ready_login()
+            grabber.warm_pool()
+
+            server.open_at = server.now() + open_delay
+            start = time.monotonic()
+            if concurrent:
+                grabber.http_grab_concurrent()
+            else:
+                grabber.http_grab_lesson()
+            elapsed[concurrent].append((time.monotonic() - start) * 1000)
+            enrolled[concurrent] += sum(len(taken) for taken in server.enrolled.values())
+            server.shutdown()
+
+    for concurrent, times in elapsed.items():
+        mode = '並行' if concurrent else '逐一'
+        print(f'{mode}: 全部送完平均 {sum(times) / len(times):.0f} ms（含登出），共加選 {enrolled[concurrent]} 門')
+    print('並行模式每次加選的延遲：')
+    histogram([t * 1000 for t in grabber.post_latencies])
+    return elapsed
+
+def summarize(events) -> dict:
+    """Times (ms) from the fire mark to the first success and to the last answer, plus mean stage gaps"""
+    fire = max(e['t'] for e in events if e['event'] == 'fire')
+    events = [e for e in events if e['t'] >= fire]
+    answers = [e for e in events if e['event'] in ('accept', 'response')]
+    success = [e for e in events if e.get('text', '').find(grabber.grab_success) != -1]
+
+    stages = defaultdict(list)
+    posts = {}
+    for prev, e in zip(events, events[1:]):
+        if e['event'] in ('click', 'alert', 'accept'):
+            stages[f"{prev['event']}→{e['event']}"].append(e['t'] - prev['t'])
+    for e in events:
+        if e['event'] == 'post':
+            posts[e['row']] = e['t']
+        elif e['event'] == 'response':
+            stages['post→response'].append(e['t'] - posts[e['row']])
+
+    result = {
+        'first_success_ms': (success[0]['t'] - fire) * 1000 if success else None,
+        'all_done_ms': (answers[-1]['t'] - fire) * 1000 if answers else None,
+    }
+    result.update({f'{stage}_ms': mean(gaps) * 1000 for stage, gaps in stages.items()})
+    return result
+
+def run_mode(server, mode) -> None:
+    """Prepare and grab once against the server in this mode"""
+    grabber.url, grabber.name, grabber.passwd = server.url, 'test', server.password
+    grabber.grab_mode = 'selenium' if mode == 'selenium' else 'http'
+    grabber.concurrent_grab = mode == 'concurrent'
+    grabber.row_payloads.clear()
+    grabber.driver = None
+    if mode == 'selenium':
+        grabber.create_driver()
+        grabber.fresh_login()
+        grabber.cache_rows()
+    else:
+        grabber.http_ready_login()
+        grabber.warm_pool()
+
+    grabber.mark('fire')
+    grabber.http_or_selenium_grab()
+
+def benchmark(latencies = (0.005, 0.02, 0.05), runs = 5, modes = ('selenium', 'http', 'concurrent'), trace_dir = None):
+    """Replay the grab against the mock at each server latency, per mode
+
+    Every run writes its trace (grabber.save_trace) when trace_dir is given.
+    Selenium is skipped if no browser can be started.
+    """
+    rows = []
+    for latency in latencies:
+        for mode in modes:
+            for run in range(runs):
+                server = MockServer(latency=latency).start()
+                grabber.trace.clear()
+                try:
+                    run_mode(server, mode)
+                except (WebDriverException, OSError) as e:
+                    print(f'略過 {mode}: {e!r}')
+                    server.shutdown()
+                    break
+                server.shutdown()
+                if trace_dir:
+                    grabber.save_trace(f'{trace_dir}/trace_{mode}_{latency * 1000:g}ms_{run}.json')
+                rows.append({'latency_ms': latency * 1000, 'mode': mode, **summarize(grabber.trace)})
+
+    keys = sorted({k for row in rows for k in row} - {'latency_ms', 'mode'})
+    print('latency_ms  mode        ' + '  '.join(f'{k:>20}' for k in keys))
+    for latency in latencies:
+        for mode in modes:
+            group = [row for row in rows if row['latency_ms'] == latency * 1000 and row['mode'] == mode]
+            if not group:
+                continue
+            values = [mean(r[k] for r in group if r.get(k) is not None) if any(r.get(k) is not None for r in group) else float('nan') for k in keys]
+            print(f'{latency * 1000:10g}  {mode:10}  ' + '  '.join(f'{v:20.1f}' for v in values))
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks and benchmarks against a local stand-in server')
+    parser.add_argument('check', nargs='?', default='all', choices=['all', 'clock', 'http', 'concurrent', 'bench'])
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.005, 0.02, 0.05], help='server round trip (s) for bench')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--trace-dir', help='write every bench run\'s JSON trace here')
+    args = parser.parse_args()
+
+    if args.check in ('all', 'clock'):
+        check_clock()
+    if args.check in ('all', 'http'):
+        check_http()
+    if args.check in ('all', 'concurrent'):
+        check_concurrent()
+    if args.check in ('all', 'bench'):
+        benchmark(args.latency, args.runs, trace_dir=args.trace_dir)
@@ -0,0 +1,448 @@
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import wait
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from sklearn.ensemble import RandomForestClassifier
+
+from feature_engineer import (
+    build_tick_windows,
+    cal_breakthrough,
+    cal_features,
+    cal_pos,
+    cal_pressure,
+    cal_price,
+    cal_tick_density,
+    cal_time,
+    cal_volatility,
+    extract_features,
+    get_pretrade_ticks,
+    profile_features,
+    prune_feature_spec,
+)
+from ocr_extractor import ClockModel
+from synthetic import make_ticks, make_trades
+from tick_archive import read_archive, write_archive
+from tick_multi_symbol import MultiSymbolBrowser
+from tick_visualizer import TradeBrowser
+
+SIZES = (1_000, 10_000, 100_000)
+TICKS_PER_TRADE = 100
+
+
+def best_of(func, *args, repeats: int = 3) -> float:
+    """Best wall time in seconds over repeats"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_features(sizes: tuple[int, ...] = SIZES, seed: int = 0) -> pd.DataFrame:
+    """Time the cal_* functions and the window/feature pipeline at each size
+
+    For cal_* the size is the number of ticks in the frame. The pipeline
+    stages run on that many ticks with one trade per TICKS_PER_TRADE ticks,
+    so their items are trades (get_pretrade_ticks, build_tick_windows) or
+    windows (extract_features).
+    """
+    rows = []
+    for size in sizes:
+        ticks = make_ticks(size, seed)
+        trades = make_trades(ticks, size // TICKS_PER_TRADE, seed)
+
+        for func in [
+            cal_time,
+            cal_price,
+            cal_pressure,
+            cal_volatility,
+            cal_breakthrough,
+            cal_tick_density,
+            cal_pos,
+            cal_features,
+        ]:
+            rows.append((func.__name__, size, 1, best_of(func, ticks)))
+
+        def pretrade_all():
+            for _, trade in trades.iterrows():
+                get_pretrade_ticks(trade, ticks, 110)
+
+        pos, neg = build_tick_windows(trades, ticks)
+        windows = pos + neg
+        rows += [
+            ("get_pretrade_ticks", size, len(trades), best_of(pretrade_all)),
+            (
+                "build_tick_windows",
+                size,
+                len(trades),
+                best_of(build_tick_windows, trades, ticks),
+            ),
+            (
+                "extract_features",
+                size,
+                len(windows),
+                best_of(extract_features, windows, 1, repeats=1),
+            ),
+        ]
+
+    result = pd.DataFrame(rows, columns=["stage", "size", "items", "seconds"])
+    result["ms"] = result.pop("seconds") * 1e3
+    result["us_per_item"] = result["ms"] / result["items"] * 1e3
+    return result
+
+
+def bench_pruning(
+    size: int = 20_000, coverage: float = 0.5, seed: int = 0
+) -> pd.DataFrame:
+    """Per-family time of extract_features, then full vs importance-pruned spec
+
+    Labels are the usual entry / 10-ticks-earlier windows, so on synthetic
+    ticks the importances are noise; the point is the cost of the spec.
+    """
+    ticks = make_ticks(size, seed)
+    trades = make_trades(ticks, size // TICKS_PER_TRADE, seed)
+    pos, neg = build_tick_windows(trades, ticks)
+
+    with profile_features() as family_times:
+        start = time.perf_counter()
+        features = pd.concat(
+            [extract_features(pos, 1), extract_features(neg, 0)], ignore_index=True
+        )
+        full = time.perf_counter() - start
+
+    X, y = features.drop(columns="label"), features["label"]
+    forest = RandomForestClassifier(100, random_state=seed, n_jobs=-1).fit(X, y)
+    importance = pd.DataFrame(
+        {"feature": X.columns, "importance": forest.feature_importances_}
+    )
+    spec = prune_feature_spec(importance, coverage)
+    pruned = best_of(extract_features, pos + neg, 1, spec, repeats=1)
+
+    rows = [(f"family:{name}", seconds) for name, seconds in family_times.items()]
+    rows += [("extract_features:full", full), ("extract_features:pruned", pruned)]
+    result = pd.DataFrame(rows, columns=["stage", "seconds"])
+    result["ms"] = result.pop("seconds") * 1e3
+    result["share"] = result["ms"] / (full * 1e3)
+    return result
+
+
+def bench_archive(
+    sizes: tuple[int, ...] = (100_000, 1_000_000), seed: int = 0
+) -> pd.DataFrame:
+    """File size and load time of the tick archive vs Parquet
+
+    full loads the whole file; range loads the middle 1% of the time span,
+    which the archive serves from its chunk index and Parquet by loading
+    everything and slicing, as the visualizers do today.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            ticks = make_ticks(size, seed)
+            span = ticks.index[-1] - ticks.index[0]
+            start = ticks.index[0] + span * 0.495
+            end = start + span * 0.01
+
+            parquet, archive = Path(tmp) / "ticks.parquet", Path(tmp) / "ticks.ticks"
+            ticks.to_parquet(parquet)
+            write_archive(ticks, archive)
+
+            for name, path, load, load_range in [
+                (
+                    "parquet",
+                    parquet,
+                    pd.read_parquet,
+                    lambda path: pd.read_parquet(path).loc[start:end],
+                ),
+                (
+                    "archive",
+                    archive,
+                    read_archive,
+                    lambda path: read_archive(path, start, end),
+                ),
+            ]:
+                nbytes = path.stat().st_size
+                rows.append(
+                    (
+                        name,
+                        size,
+                        nbytes / 2**20,
+                        nbytes / size,
+                        best_of(load, path) * 1e3,
+                        best_of(load_range, path) * 1e3,
+                    )
+                )
+
+    return pd.DataFrame(
+        rows,
+        columns=["format", "size", "mb", "bytes_per_tick", "full_ms", "range_ms"],
+    )
+
+
+SINGLE_STEPS = (
+    ["next"] * 30 + ["prev"] * 15 + ["mode"] + ["next"] * 15 + ["mode"] + ["next"] * 15
+)
+MULTI_STEPS = ["next"] * 30 + ["prev"] * 15 + [30, 60, 5] + ["next"] * 15
+
+
+def check_marker_dates(fig: go.Figure) -> int:
+    """Entry / exit marker x values must serialize as dates, not integers
+
+    Plotly reads integers on a date axis as epoch milliseconds, so markers
+    stored as datetime64 nanoseconds vanish. Returns the number checked.
+    """
+    xs = [
+        x
+        for trace in json.loads(fig.to_json())["data"]
+        if trace.get("name") in ("Price", "End Price")
+        for x in trace.get("x", [])
+        if x is not None
+    ]
+    if bad := [x for x in xs if not isinstance(x, str)]:
+        raise AssertionError(f"進出場點的 x 不是日期：{bad[:3]}")
+    return len(xs)
+
+
+def replay(show, steps: list, traces, settle=None) -> list[tuple[str, float, int]]:
+    """Time each show() call of a navigation sequence
+
+    Returns (action, seconds, traces created) per step; a trace counts as
+    created when its object was not in the figure before. settle() runs
+    after each step, outside the timing.
+    """
+    seen = {id(trace): trace for trace in traces()}
+    rows = []
+    for action in steps:
+        start = time.perf_counter()
+        show(action)
+        elapsed = time.perf_counter() - start
+        new = [trace for trace in traces() if id(trace) not in seen]
+        seen.update((id(trace), trace) for trace in new)
+        rows.append((action, elapsed, len(new)))
+        if settle:
+            settle()
+    return rows
+
+
+def bench_visualizer(size: int = 200_000, seed: int = 0) -> pd.DataFrame:
+    """Per-step latency of the visualizers' update paths, without widgets
+
+    Replays next / prev, view mode toggles (tick_visualizer) and window
+    slider changes (tick_multi_symbol) on go.Figure over synthetic ticks.
+    Between steps the browsers' prefetch is allowed to finish, as it would
+    while the user looks at the chart.
+    """
+    ticks = make_ticks(size, seed)
+    trades = make_trades(ticks, size // TICKS_PER_TRADE, seed)
+    rows = []
+
+    browser = TradeBrowser(go.Figure(), trades, ticks)
+    state = {"idx": 0, "mode": "Tick"}
+
+    def show_single(action: str):
+        if action == "mode":
+            state["mode"] = "Time" if state["mode"] == "Tick" else "Tick"
+        else:
+            step = 1 if action == "next" else -1
+            state["idx"] = max(0, min(len(trades) - 1, state["idx"] + step))
+        browser.show(state["idx"], state["mode"])
+
+    checked = []
+
+    def settle_single():
+        wait(browser.prefetched)
+        checked.append(check_marker_dates(browser.fig))
+
+    browser.show(0, "Tick")
+    wait(browser.prefetched)
+    for action, seconds, created in replay(
+        show_single, SINGLE_STEPS, lambda: browser.fig.data, settle_single
+    ):
+        rows.append(("tick_visualizer", action, seconds, created))
+
+    symbols = {"usdjpy": 143.0, "eurjpy": 160.0, "xauusd": 2600.0}
+    ticks_dict = {
+        symbol: make_ticks(size, seed + i, price=price)
+        for i, (symbol, price) in enumerate(symbols.items())
+    }
+    trades_dict = {
+        symbol: make_trades(ticks, size // TICKS_PER_TRADE, seed, symbol=symbol)
+        for symbol, ticks in ticks_dict.items()
+    }
+    fig = make_subplots(rows=len(symbols), cols=1, shared_xaxes=True)
+    multi = MultiSymbolBrowser(fig, trades_dict, ticks_dict)
+    state = {"idx": 0, "seconds": 10}
+
+    def show_multi(action):
+        if isinstance(action, int):
+            state["seconds"] = action
+        else:
+            step = 1 if action == "next" else -1
+            last = len(multi.primary_trades) - 1
+            state["idx"] = max(0, min(last, state["idx"] + step))
+        multi.show(state["idx"], state["seconds"])
+
+    def settle_multi():
+        wait(multi.prefetched)
+        checked.append(check_marker_dates(fig))
+
+    multi.show(0, 10)
+    wait(multi.prefetched)
+    for action, seconds, created in replay(
+        show_multi, MULTI_STEPS, lambda: fig.data, settle_multi
+    ):
+        action = "slider" if isinstance(action, int) else action
+        rows.append(("tick_multi_symbol", action, seconds, created))
+    if not sum(checked):
+        raise AssertionError("重播過程中沒有任何進出場點可檢查")
+
+    steps = pd.DataFrame(rows, columns=["view", "action", "seconds", "traces"])
+    steps["ms"] = steps.pop("seconds") * 1e3
+    grouped = steps.groupby(["view", "action"], sort=False)
+    result = grouped["ms"].describe(percentiles=[0.5, 0.9, 0.99])
+    result = result[["count", "50%", "90%", "99%", "max"]].set_axis(
+        ["steps", "p50_ms", "p90_ms", "p99_ms", "max_ms"], axis=1
+    )
+    result["steps"] = result["steps"].astype(int)
+    result["traces_created"] = grouped["traces"].sum()
+    return result.reset_index()
+
+
+CLOCK_SCENARIOS = [
+    # (drift, misread rate, clock jump in seconds)
+    (1.0, 0.0, 0),
+    (1.0002, 0.0, 0),
+    (0.999, 0.0, 0),
+    (0.998, 0.0, 0),
+    (1.0, 0.1, 0),
+    (1.0002, 0.1, 0),
+    (1.0, 0.0, 3),
+    (1.0, 0.0, -2),
+    (1.0002, 0.0, 30),
+]
+
+
+def bench_clock(
+    scenarios: list = CLOCK_SCENARIOS,
+    closes: int = 400,
+    frames: int = 120_000,
+    fps: float = 30.0,
+    seeds: int = 4,
+) -> pd.DataFrame:
+    """End times from ClockModel vs reading the clock at every close
+
+    A simulated recording whose clock runs drift times as fast as frame_pos
+    / fps says, starting just before midnight. A misread shifts one field
+    of the reading by one; a jump moves the clock halfway through, as a
+    paused recording or a corrected system clock would. Times are taken
+    after ClockModel's revisions. wrong counts closes whose HH:MM:SS
+    differs from the true clock, baseline_wrong the same for one OCR per
+    close, and regressions the closes only ClockModel got wrong (summed
+    over seeds). Raises AssertionError if a clean-reading jump has any.
+    """
+    rows = []
+    for drift, misread, jump in scenarios:
+        reads = wrong = baseline_wrong = regressions = 0
+        for seed in range(seeds):
+            rng = np.random.default_rng(seed)
+            start = 23 * 3600 + 50 * 60 + rng.random()
+
+            def true_text(pos: int) -> str:
+                seconds = start + pos / fps * drift + jump * (pos >= frames // 2)
+                seconds = int(seconds) % ClockModel.DAY
+                return (
+                    f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+                )
+
+            class Frame:
+                reads = 0
+
+                def __init__(self, frame_pos: int):
+                    self.frame_pos = frame_pos
+                    fields = true_text(frame_pos).split(":")
+                    if rng.random() < misread:
+                        k = rng.integers(3)
+                        fields[k] = f"{(int(fields[k]) + rng.choice([-1, 1])) % 60:02d}"
+                    self.reading = ":".join(fields)
+
+                @cached_property
+                def timestamp(self) -> str:
+                    Frame.reads += 1
+                    return self.reading
+
+            clock = ClockModel(fps)
+            readers = [
+                Frame(int(pos))
+                for pos in np.sort(rng.choice(frames, closes, replace=False))
+            ]
+            times = {}
+            for i, frame in enumerate(readers):
+                times[i] = clock.timestamp(frame, i)
+                times.update(clock.revisions())
+            for i, frame in enumerate(readers):
+                truth = true_text(frame.frame_pos)
+                wrong += times[i] != truth
+                baseline_wrong += frame.reading != truth
+                regressions += times[i] != truth and frame.reading == truth
+            reads += Frame.reads
+
+        if jump and not misread and regressions:
+            raise AssertionError(f"時鐘跳 {jump} 秒後有 {regressions} 筆比逐筆 OCR 差")
+        ppm = round((drift - 1) * 1e6)
+        rows.append(
+            (ppm, misread, jump, reads / seeds, wrong, baseline_wrong, regressions)
+        )
+
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "drift_ppm",
+            "misread",
+            "jump_s",
+            "ocr_calls",
+            "wrong",
+            "baseline_wrong",
+            "regressions",
+        ],
+    )
+
+
+SUITES = {
+    "features": bench_features,
+    "pruning": bench_pruning,
+    "archive": bench_archive,
+    "visualizer": bench_visualizer,
+    "clock": bench_clock,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic ticks")
+    parser.add_argument("suites", nargs="*", help=f"any of {list(SUITES)}")
+    parser.add_argument(
+        "--csv", type=Path, help="append each suite to {stem}_{suite}.csv"
+    )
+    args = parser.parse_args()
+    if unknown := set(args.suites) - set(SUITES):
+        parser.error(f"unknown suites: {sorted(unknown)}")
+
+    for name in args.suites or SUITES:
+        result = SUITES[name]()
+        print(f"\n[{name}]")
+        print(result.round(2).to_string(index=False))
+
+        if args.csv:
+            # One file per suite: their columns differ
+            path = args.csv.with_name(f"{args.csv.stem}_{name}{args.csv.suffix}")
+            result.insert(0, "date", pd.Timestamp.now().floor("s"))
+            header = not path.exists()
+            result.to_csv(path, mode="a", header=header, index=False)
@@ -1,14 +1,29 @@
+import re
+import time
 import warnings
+from collections import defaultdict, deque
+from contextlib import contextmanager
 from pathlib import Path
 
 import numpy as np  # noqa
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.stats import randint
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa
 from sklearn.metrics import classification_report
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import (
+    HalvingRandomSearchCV,
+    cross_validate,
+    train_test_split,
+)
 from skopt import BayesSearchCV
 from skopt.space import Categorical, Integer
 
+from tick_archive import load_ticks
+
 warnings.filterwarnings("ignore")
 
 DATA_DIR = Path("../data")
@@ -27,7 +42,7 @@ def load_data(
         .reset_index(drop=True)
     )
     trades[["Time", "End Time"]] = trades[["Time", "End Time"]].apply(pd.to_datetime)
-    ticks = pd.read_parquet(DATA_DIR / f"{symbol.upper()}_20240923.parquet")
+    ticks = load_ticks(DATA_DIR / f"{symbol.upper()}_20240923")
     return trades, ticks
 
 
@@ -53,7 +68,13 @@ def split_tick_windows(
 ) -> tuple[list[pd.DataFrame], list[pd.DataFrame]]:
     """Create positive (entry point) and negative (10 ticks before) samples"""
     trades, ticks = load_data(symbol, trade_type)
+    return build_tick_windows(trades, ticks, lookback)
+
 
+def build_tick_windows(
+    trades: pd.DataFrame, ticks: pd.DataFrame, lookback: int = 100
+) -> tuple[list[pd.DataFrame], list[pd.DataFrame]]:
+    """split_tick_windows on already loaded trades and ticks"""
     pos, neg = [], []
     for _, trade in trades.iterrows():
         tick_window = get_pretrade_ticks(trade, ticks, lookback + 10)
@@ -63,21 +84,104 @@ def split_tick_windows(
     return pos, neg
 
 
+def to_distributions(param_space: dict) -> dict:
+    """Convert skopt dimensions to distributions for sklearn's random searches"""
+    return {
+        name: list(dim.categories)
+        if isinstance(dim, Categorical)
+        else randint(dim.low, dim.high + 1)
+        for name, dim in param_space.items()
+    }
+
+
 def train_model(
-    X_train: pd.DataFrame, y_train: pd.Series, param_space: dict
-) -> BayesSearchCV:
-    """訓練模型並執行Bayesian參數搜尋"""
-    bayes_search = BayesSearchCV(
-        RandomForestClassifier(random_state=42),
-        param_space,
-        n_iter=50,
-        cv=5,
-        n_jobs=-1,
-        verbose=0,
-        random_state=42,
-    )
-    bayes_search.fit(X_train, y_train)
-    return bayes_search
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    param_space: dict,
+    search: str = "bayes",
+    cv: int | list = 5,
+) -> BayesSearchCV | HalvingRandomSearchCV:
+    """訓練模型並執行參數搜尋（bayes：Bayesian，halving：successive halving）"""
+    if search == "halving":
+        # Halve on n_estimators: 54 candidates x 11 trees -> ... -> 2 x 297 trees
+        factor, rungs = 3, 3
+        max_trees = param_space["n_estimators"].high
+        space = {k: v for k, v in param_space.items() if k != "n_estimators"}
+        model = HalvingRandomSearchCV(
+            RandomForestClassifier(random_state=42),
+            to_distributions(space),
+            n_candidates=2 * factor**rungs,
+            factor=factor,
+            resource="n_estimators",
+            min_resources=max_trees // factor**rungs,
+            max_resources=max_trees,
+            cv=cv,
+            n_jobs=-1,
+            verbose=0,
+            random_state=42,
+        )
+    elif search == "bayes":
+        model = BayesSearchCV(
+            RandomForestClassifier(random_state=42),
+            param_space,
+            n_iter=50,
+            cv=cv,
+            n_jobs=-1,
+            verbose=0,
+            random_state=42,
+        )
+    else:
+        raise ValueError(f"未知的搜尋模式：{search}")
+
+    model.fit(X_train, y_train)
+    return model
+
+
+def search_cost(model: BayesSearchCV | HalvingRandomSearchCV) -> dict:
+    """Count the forest fits and trees built during a search (including refit)"""
+    results = model.cv_results_
+    if "n_resources" in results:
+        trees = np.asarray(results["n_resources"])
+    else:
+        trees = np.asarray(results["param_n_estimators"], dtype=int)
+
+    return {
+        "fits": len(trees) * model.n_splits_ + 1,
+        "trees": int(trees.sum()) * model.n_splits_
+        + model.best_estimator_.n_estimators,
+    }
+
+
+def compare_search_modes(
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_test: pd.DataFrame,
+    y_test: pd.Series,
+    param_space: dict,
+    cv: int | list = 5,
+) -> pd.DataFrame:
+    """比較不同搜尋模式的成本與準確率"""
+    rows = []
+    for search in ["bayes", "halving"]:
+        start = time.perf_counter()
+        model = train_model(X_train, y_train, param_space, search, cv)
+        elapsed = time.perf_counter() - start
+
+        rows.append(
+            {
+                "search": search,
+                **search_cost(model),
+                "wall_time": round(elapsed, 1),
+                "cv_score": model.best_score_,
+                "test_score": model.score(X_test, y_test),
+                "best_params": dict(model.best_params_),
+            }
+        )
+
+    comparison = pd.DataFrame(rows).set_index("search")
+    print("\n搜尋模式比較：")
+    print(comparison.drop(columns="best_params").to_string())
+    return comparison
 
 
 def evaluate_model(
@@ -101,30 +205,275 @@ def evaluate_model(
     return feature_importance
 
 
-def train_evaluate_model(param_space: dict):
-    """執行完整的模型訓練和評估流程"""
-    pos, neg = split_tick_windows()
-    pos_features = extract_features(pos, 1)
-    neg_features = extract_features(neg, 0)
+class FlatForest:
+    """RandomForest flattened into contiguous node arrays for batch inference
+
+    Nodes of all trees live in one set of arrays and leaves point to
+    themselves, so a block of samples walks every tree in lockstep for
+    max_depth steps with plain NumPy gathers.
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.missing_left = arrays["missing_left"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        self.classes_ = arrays["classes"]
+        self.feature_names_in_ = arrays["feature_names_in"]
+        self.is_leaf = self.left == np.arange(len(self.left))
+
+    @classmethod
+    def from_estimator(
+        cls, model: BayesSearchCV | RandomForestClassifier
+    ) -> "FlatForest":
+        """Flatten a fitted forest (or a search's best_estimator_)"""
+        forest = getattr(model, "best_estimator_", model)
+        parts = {k: [] for k in ["feature", "threshold", "left", "right"]}
+        parts.update(missing_left=[], value=[])
+        roots, offset, max_depth = [], 0, 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            proba = tree.value[:, 0, :]
+            normalizer = proba.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0] = 1
+
+            parts["feature"].append(np.where(is_leaf, 0, tree.feature))
+            parts["threshold"].append(tree.threshold)
+            parts["left"].append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            parts["right"].append(
+                np.where(is_leaf, nodes, tree.children_right) + offset
+            )
+            parts["missing_left"].append(
+                getattr(tree, "missing_go_to_left", np.zeros(tree.node_count))
+            )
+            parts["value"].append(proba / normalizer)
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            {
+                "feature": np.concatenate(parts["feature"]).astype(np.intp),
+                "threshold": np.concatenate(parts["threshold"]),
+                "left": np.concatenate(parts["left"]).astype(np.intp),
+                "right": np.concatenate(parts["right"]).astype(np.intp),
+                "missing_left": np.concatenate(parts["missing_left"]).astype(bool),
+                "value": np.concatenate(parts["value"]),
+                "roots": np.array(roots, dtype=np.intp),
+                "max_depth": np.array(max_depth),
+                "classes": forest.classes_,
+                "feature_names_in": np.asarray(
+                    getattr(forest, "feature_names_in_", []), dtype=str
+                ),
+            }
+        )
+
+    def save(self, path: Path | str):
+        np.savez(
+            path,
+            feature=self.feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            missing_left=self.missing_left,
+            value=self.value,
+            roots=self.roots,
+            max_depth=np.array(self.max_depth),
+            classes=self.classes_,
+            feature_names_in=self.feature_names_in_,
+        )
+
+    @classmethod
+    def load(cls, path: Path | str) -> "FlatForest":
+        with np.load(path) as arrays:
+            return cls(dict(arrays))
+
+    def predict_proba(self, X, block_size: int = 4096) -> np.ndarray:
+        """Average leaf class probabilities, same as RandomForest.predict_proba"""
+        X = np.asarray(X, dtype=np.float32)  # sklearn trees split on float32
+        n_trees, n_features = len(self.roots), X.shape[1]
+        proba = np.empty((len(X), self.value.shape[1]))
+
+        for lo in range(0, len(X), block_size):
+            x = X[lo : lo + block_size].ravel()
+            n = len(x) // n_features
+            # One (sample, tree) path per entry; finished paths drop out
+            node = np.tile(self.roots, n)
+            offset = np.repeat(np.arange(n) * n_features, n_trees)
+            active = np.flatnonzero(~self.is_leaf[node])
+            for _ in range(self.max_depth):
+                if not active.size:
+                    break
+                current = node[active]
+                values = x[offset[active] + self.feature[current]]
+                go_left = (values <= self.threshold[current]) | (
+                    np.isnan(values) & self.missing_left[current]
+                )
+                node[active] = np.where(
+                    go_left, self.left[current], self.right[current]
+                )
+                active = active[~self.is_leaf[node[active]]]
+            proba[lo : lo + n] = self.value[node].reshape(n, n_trees, -1).mean(axis=1)
+
+        return proba
+
+    def predict(self, X, block_size: int = 4096) -> np.ndarray:
+        return self.classes_[self.predict_proba(X, block_size).argmax(axis=1)]
+
+
+def benchmark_flat_forest(
+    model: BayesSearchCV | RandomForestClassifier,
+    X: pd.DataFrame,
+    batch_sizes: tuple[int, ...] = (1, 64, 4096),
+    repeats: int = 5,
+) -> pd.DataFrame:
+    """比較 FlatForest 與 sklearn predict_proba 在不同批量下的延遲"""
+    forest = getattr(model, "best_estimator_", model)
+    flat = FlatForest.from_estimator(forest)
+
+    max_diff = np.abs(forest.predict_proba(X) - flat.predict_proba(X)).max()
+
+    rows = []
+    for batch_size in batch_sizes:
+        batch = X.iloc[:batch_size]
+        row = {"batch_size": len(batch)}
+        for name, predict in [
+            ("sklearn", forest.predict_proba),
+            ("flat", flat.predict_proba),
+        ]:
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                predict(batch)
+                timings.append(time.perf_counter() - start)
+            row[f"{name}_us_per_sample"] = min(timings) / len(batch) * 1e6
+        rows.append(row)
+
+    result = pd.DataFrame(rows).set_index("batch_size")
+    result["speedup"] = result["sklearn_us_per_sample"] / result["flat_us_per_sample"]
+    print(f"\n推論延遲比較（{len(forest.estimators_)} 棵樹）：")
+    print(result.round(2).to_string())
+    print(f"最大機率差異：{max_diff:.2e}")
+    return result
+
+
+def build_dataset(
+    symbol: str = "usdjpy",
+    trade_type: str = "buy",
+    lookback: int = 100,
+    spec: dict[int, list[str]] | None = None,
+) -> pd.DataFrame:
+    """Compute the feature matrix once, with each window's start/end tick time"""
+    pos, neg = split_tick_windows(symbol, trade_type, lookback)
+    pos_features = extract_features(pos, 1, spec)
+    neg_features = extract_features(neg, 0, spec)
 
     features = pd.concat([pos_features, neg_features], ignore_index=True)
-    X = features.drop("label", axis=1)
-    y = features["label"]
+    windows = pos + neg
+    features["start"] = [window.index[0] for window in windows]
+    features["end"] = [window.index[-1] for window in windows]
+    return features
+
+
+def walk_forward_splits(
+    start: pd.Series, end: pd.Series, n_splits: int = 5
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Purged walk-forward folds over positional indices
+
+    Samples are ordered by window end (the trade time) and cut into
+    n_splits + 1 blocks; fold k tests on block k and trains on the blocks
+    before it. Training windows that end after the first test window starts
+    share ticks with the test set and are purged.
+    """
+    start, end = start.to_numpy(), end.to_numpy()
+    blocks = np.array_split(np.argsort(end, kind="stable"), n_splits + 1)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+    splits = []
+    for k in range(1, n_splits + 1):
+        test = blocks[k]
+        train = np.concatenate(blocks[:k])
+        train = train[end[train] < start[test].min()]
+        splits.append((train, test))
+    return splits
+
+
+def walk_forward_cv(
+    features: pd.DataFrame, params: dict | None = None, n_splits: int = 5
+) -> pd.DataFrame:
+    """Score fixed model params on purged walk-forward folds, in parallel"""
+    X = features.drop(columns=["label", "start", "end"])
+    y = features["label"]
+    splits = walk_forward_splits(features["start"], features["end"], n_splits)
+
+    scores = cross_validate(
+        RandomForestClassifier(random_state=42, **(params or {})),
+        X,
+        y,
+        cv=splits,
+        scoring=["accuracy", "f1", "roc_auc"],
+        n_jobs=-1,
     )
+    result = pd.DataFrame(scores)
+    result["n_train"] = [len(train) for train, _ in splits]
+    result["n_test"] = [len(test) for _, test in splits]
+
+    print("\nWalk-forward CV：")
+    print(result.to_string())
+    print(result[["test_accuracy", "test_f1", "test_roc_auc"]].mean().to_string())
+    return result
+
+
+def train_evaluate_model(
+    param_space: dict,
+    search: str = "bayes",
+    cv: str = "random",
+    spec: dict[int, list[str]] | None = None,
+) -> pd.DataFrame | None:
+    """執行完整的模型訓練和評估流程（cv：random 或 walk_forward）"""
+    features = build_dataset(spec=spec)
+    X = features.drop(columns=["label", "start", "end"])
+    y = features["label"]
+
+    if cv == "walk_forward":
+        # Hold out the last block, search on purged folds of the earlier ones
+        splits = walk_forward_splits(features["start"], features["end"])
+        train_idx, test_idx = splits[-1]
+        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
+        train_features = features.iloc[train_idx]
+        search_cv = walk_forward_splits(
+            train_features["start"], train_features["end"], n_splits=4
+        )
+    elif cv == "random":
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y
+        )
+        search_cv = 5
+    else:
+        raise ValueError(f"未知的驗證模式：{cv}")
+
+    if search == "compare":
+        compare_search_modes(X_train, y_train, X_test, y_test, param_space, search_cv)
+        return
 
-    model = train_model(X_train, y_train, param_space)
-    _ = evaluate_model(model, X_test, y_test, X)
-    return
+    model = train_model(X_train, y_train, param_space, search, search_cv)
+    return evaluate_model(model, X_test, y_test, X)
 
 
-def extract_features(df_list: list[pd.DataFrame], label: int) -> pd.DataFrame:
+def extract_features(
+    df_list: list[pd.DataFrame], label: int, spec: dict[int, list[str]] | None = None
+) -> pd.DataFrame:
     """從tick資料列表中提取特徵"""
     all_features = []
     for df in df_list:
-        features = cal_features(df)
+        features = cal_features(df, spec=spec)
         all_features.append(features)
 
     features_df = pd.DataFrame(all_features)
@@ -279,26 +628,353 @@ def cal_tick_density(df: pd.DataFrame, prefix: str = "") -> dict:
     return features
 
 
-def cal_pos(df: pd.DataFrame, prefix: str = "") -> dict:
-    """Aggregate all feature types for a given position"""
+# Feature family -> (function, feature names it produces)
+FEATURE_FAMILIES = {
+    "time": (
+        cal_time,
+        ("time_diff", "time_ratio", "time_zscore", "time_acceleration"),
+    ),
+    "price": (
+        cal_price,
+        ("price_change", "relative_change", "spread", "spread_change", "breakthrough"),
+    ),
+    "pressure": (cal_pressure, ("buy_pressure", "sell_pressure")),
+    "volatility": (
+        cal_volatility,
+        ("volatility", "price_momentum", "direction_consistency"),
+    ),
+    "breakthrough": (
+        cal_breakthrough,
+        (
+            "breakthrough_2",
+            "breakthrough_3",
+            "breakthrough_4",
+            "breakthrough_consistency",
+        ),
+    ),
+    "tick_density": (
+        cal_tick_density,
+        ("tick_density_3", "tick_density_5", "tick_density_10", "density_change"),
+    ),
+}
+
+_family_times: defaultdict | None = None
+
+
+@contextmanager
+def profile_features():
+    """Accumulate seconds spent in each feature family inside the block
+
+    Only calls in this process are recorded, so profile scan_day with
+    n_jobs=1.
+    """
+    global _family_times
+    _family_times = defaultdict(float)
+    try:
+        yield _family_times
+    finally:
+        _family_times = None
+
+
+def cal_pos(
+    df: pd.DataFrame, prefix: str = "", families: list[str] | None = None
+) -> dict:
+    """Aggregate the given feature families (all by default) for a position"""
     features = {}
-    features.update(cal_time(df, prefix))
-    features.update(cal_price(df, prefix))
-    features.update(cal_pressure(df, prefix))
-    features.update(cal_volatility(df, prefix))
-    features.update(cal_breakthrough(df, prefix))
-    features.update(cal_tick_density(df, prefix))
+    for family in families or FEATURE_FAMILIES:
+        func = FEATURE_FAMILIES[family][0]
+        if _family_times is None:
+            features.update(func(df, prefix))
+        else:
+            start = time.perf_counter()
+            features.update(func(df, prefix))
+            _family_times[family] += time.perf_counter() - start
     return features
 
 
-def cal_features(df: pd.DataFrame, n: int = 5) -> dict:
-    """Calculate features for last N tick positions to avoid lookahead bias"""
+def cal_features(
+    df: pd.DataFrame, n: int = 5, spec: dict[int, list[str]] | None = None
+) -> dict:
+    """Calculate features for last N tick positions to avoid lookahead bias
+
+    spec maps position -> feature families; positions and families left out
+    are skipped entirely.
+    """
+    spec = spec or {i: list(FEATURE_FAMILIES) for i in range(1, n + 1)}
     features = {}
-    for i in range(1, n + 1):
+    for i, families in spec.items():
         current_df = df.iloc[: -i + 1] if i > 1 else df
-        pos_features = cal_pos(current_df, f"pos_{i}_")
+        pos_features = cal_pos(current_df, f"pos_{i}_", families)
         features.update(pos_features)
     return features
 
 
-train_evaluate_model(param_space)
+def spec_from_columns(columns) -> dict[int, list[str]]:
+    """Smallest feature spec that still produces every given column"""
+    family_of = {
+        name: family
+        for family, (_, names) in FEATURE_FAMILIES.items()
+        for name in names
+    }
+    needed = defaultdict(set)
+    for column in columns:
+        pos, name = re.fullmatch(r"pos_(\d+)_(.+)", column).groups()
+        needed[int(pos)].add(family_of[name])
+
+    return {
+        pos: [family for family in FEATURE_FAMILIES if family in needed[pos]]
+        for pos in sorted(needed)
+    }
+
+
+def prune_feature_spec(
+    feature_importance: pd.DataFrame, coverage: float = 0.9
+) -> dict[int, list[str]]:
+    """由特徵重要性產生精簡的特徵規格
+
+    Keeps the most important features until they cover `coverage` of the
+    total importance, then returns the positions/families they need.
+    """
+    ranked = feature_importance.sort_values("importance", ascending=False)
+    cumulative = ranked["importance"].cumsum() / ranked["importance"].sum()
+    kept = ranked["feature"][cumulative.shift(fill_value=0) < coverage]
+    spec = spec_from_columns(kept)
+
+    total = len(FEATURE_FAMILIES) * max(
+        int(re.match(r"pos_(\d+)_", f).group(1)) for f in ranked["feature"]
+    )
+    computed = sum(len(families) for families in spec.values())
+    print(f"\n保留 {len(kept)}/{len(ranked)} 個特徵，計算 {computed}/{total} 個特徵族")
+    for pos, families in spec.items():
+        print(f"pos_{pos}: {', '.join(families)}")
+    return spec
+
+
+ONLINE_FEATURES = (
+    "time_diff",
+    "spread",
+    "buy_pressure",
+    "sell_pressure",
+    "breakthrough_2",
+    "breakthrough_3",
+    "breakthrough_4",
+    "tick_density_3",
+    "tick_density_5",
+    "tick_density_10",
+)
+
+
+class OnlineFeatureEngine:
+    """Streaming subset of cal_features, updated in O(1) per tick
+
+    Only the last 10 ticks matter for ONLINE_FEATURES, so the state is a ring
+    buffer of recent ticks. pos_i features equal the pos_1 features from i-1
+    ticks ago, so pos_1 is computed once per tick and the last n results are
+    kept in a second ring buffer instead of re-scanning the window.
+    """
+
+    DENSITY_WINDOWS = (3, 5, 10)
+    BREAKTHROUGH_WINDOWS = (2, 3, 4)
+
+    def __init__(self, n: int = 5):
+        self.n = n
+        self.times = deque(maxlen=max(self.DENSITY_WINDOWS))  # int ns
+        self.bids = deque(maxlen=2)
+        self.asks = deque(maxlen=2)
+        self.changes = deque(maxlen=max(self.BREAKTHROUGH_WINDOWS))  # mid diffs
+        self.history = deque(maxlen=n)  # pos_1 features, newest last
+        self.count = 0
+
+    @staticmethod
+    def _std(values: list[float]) -> float:
+        """Sample std (ddof=1), exactly 0 for constant windows like pandas"""
+        if max(values) == min(values):
+            return 0.0
+        mean = sum(values) / len(values)
+        return (sum((v - mean) ** 2 for v in values) / (len(values) - 1)) ** 0.5
+
+    def _pos_features(self) -> dict:
+        features = {}
+        times = self.times
+
+        if self.count >= 2:
+            features["time_diff"] = (times[-1] - times[-2]) / 1e9
+            features["spread"] = self.asks[-1] - self.bids[-1]
+
+            ask_change = self.asks[-1] - self.asks[-2]
+            bid_change = self.bids[-1] - self.bids[-2]
+            total_change = abs(ask_change) + abs(bid_change)
+            features["buy_pressure"] = (
+                ask_change / total_change if total_change > 0 else 0
+            )
+            features["sell_pressure"] = (
+                abs(bid_change) / total_change if total_change > 0 else 0
+            )
+
+        if self.count >= 4:
+            current_change = abs(self.changes[-1])
+            for window in self.BREAKTHROUGH_WINDOWS:
+                if window >= self.count:  # rolling window still contains the NaN
+                    window_std = np.nan
+                else:
+                    window_std = self._std(list(self.changes)[-window:]) or 1
+                features[f"breakthrough_{window}"] = current_change / window_std
+
+        for window in self.DENSITY_WINDOWS:
+            first = times[-min(window, len(times))]
+            # Timedelta.total_seconds() truncates to microseconds
+            window_seconds = (times[-1] - first) // 1000 / 1e6
+            features[f"tick_density_{window}"] = (
+                window / window_seconds if window_seconds > 0 else 0
+            )
+
+        return features
+
+    def update(self, timestamp: pd.Timestamp, bid: float, ask: float) -> dict:
+        """Push one tick and return the pos_1..pos_n features for it"""
+        if self.bids:
+            prev_mid = (self.bids[-1] + self.asks[-1]) / 2
+            self.changes.append((bid + ask) / 2 - prev_mid)
+        self.times.append(pd.Timestamp(timestamp).value)
+        self.bids.append(bid)
+        self.asks.append(ask)
+        self.count += 1
+        self.history.append(self._pos_features())
+
+        features = {}
+        for i, pos_features in enumerate(reversed(self.history), start=1):
+            for name, value in pos_features.items():
+                features[f"pos_{i}_{name}"] = value
+        return features
+
+
+def replay_online_features(
+    path: Path | str, n: int = 5, lookback: int = 100, check_every: int = 100
+) -> pd.DataFrame:
+    """Feed a stored tick day through OnlineFeatureEngine and check parity
+
+    Every check_every ticks the online features are compared against
+    cal_features on the trailing lookback window. Returns the mismatches.
+    """
+    ticks = pd.read_parquet(path)
+    engine = OnlineFeatureEngine(n)
+
+    mismatches = []
+    elapsed = 0.0
+    checked = 0
+    for i, (timestamp, bid, ask) in enumerate(
+        zip(ticks.index, ticks["bid"].to_numpy(), ticks["ask"].to_numpy())
+    ):
+        start = time.perf_counter()
+        online = engine.update(timestamp, bid, ask)
+        elapsed += time.perf_counter() - start
+
+        if i + 1 < lookback or (i + 1 - lookback) % check_every:
+            continue
+        checked += 1
+        expected = cal_features(ticks.iloc[i + 1 - lookback : i + 1], n)
+        for name, value in online.items():
+            if not np.isclose(value, expected[name], rtol=1e-9, equal_nan=True):
+                mismatches.append(
+                    {
+                        "tick": i,
+                        "feature": name,
+                        "online": value,
+                        "batch": expected[name],
+                    }
+                )
+
+    latency = elapsed / len(ticks) * 1e6
+    print(f"\n逐筆更新平均延遲：{latency:.1f} µs（{len(ticks)} ticks）")
+    print(f"比對窗口數：{checked}，不一致：{len(mismatches)}")
+    return pd.DataFrame(mismatches, columns=["tick", "feature", "online", "batch"])
+
+
+def cal_window_features(
+    ticks: pd.DataFrame,
+    lookback: int = 100,
+    spec: dict[int, list[str]] | None = None,
+) -> list[dict]:
+    """cal_features for every tick that has a full lookback window behind it"""
+    return [
+        cal_features(ticks.iloc[end - lookback : end], spec=spec)
+        for end in range(lookback, len(ticks) + 1)
+    ]
+
+
+def scan_day(
+    model,
+    ticks: pd.DataFrame,
+    out_path: Path | str,
+    lookback: int = 100,
+    chunk_size: int = 10_000,
+    threshold: float = 0.5,
+    n_jobs: int = -1,
+) -> dict:
+    """Score every tick of a day with the entry model, chunk by chunk
+
+    Features for a chunk are computed in parallel from the chunk's ticks plus
+    lookback - 1 ticks of history, scored in one batch and appended to a
+    Parquet file aligned to the tick index, so memory stays bounded by
+    chunk_size. model can be a fitted search, a forest or a FlatForest; the
+    first lookback - 1 ticks have no full window and get a NaN signal.
+    """
+    forest = getattr(model, "best_estimator_", model)
+    columns = list(forest.feature_names_in_)
+    positive = list(model.classes_).index(1)
+    spec = spec_from_columns(columns)  # skip families the model never uses
+    n_workers = effective_n_jobs(n_jobs)
+
+    writer = None
+    fired = 0
+    start = time.perf_counter()
+    try:
+        for lo in range(0, len(ticks), chunk_size):
+            hi = min(lo + chunk_size, len(ticks))
+            first = max(lo, lookback - 1)  # first tick with a full window
+
+            # Split the chunk across workers, each with its own history
+            bounds = np.linspace(first, hi, n_workers + 1).astype(int)
+            parts = Parallel(n_jobs=n_jobs)(
+                delayed(cal_window_features)(
+                    ticks.iloc[a - lookback + 1 : b], lookback, spec
+                )
+                for a, b in zip(bounds[:-1], bounds[1:])
+                if b > a
+            )
+
+            signal = np.full(hi - lo, np.nan)
+            if first < hi:
+                X = pd.DataFrame(
+                    [row for part in parts for row in part], columns=columns
+                )
+                signal[first - lo :] = model.predict_proba(X)[:, positive]
+
+            chunk = pd.DataFrame(
+                {"tick": np.arange(lo, hi), "signal": signal},
+                index=ticks.index[lo:hi].rename("time"),
+            )
+            chunk["fire"] = chunk["signal"] >= threshold
+            fired += int(chunk["fire"].sum())
+
+            table = pa.Table.from_pandas(chunk, preserve_index=True)
+            if writer is None:
+                writer = pq.ParquetWriter(out_path, table.schema)
+            writer.write_table(table)
+            print(f"已掃描 {hi}/{len(ticks)} ticks，觸發 {fired} 次")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    summary = {
+        "ticks": len(ticks),
+        "fired": fired,
+        "fire_rate": fired / max(len(ticks) - lookback + 1, 1),
+        "seconds": time.perf_counter() - start,
+    }
+    print(f"\n全日掃描結果：{summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    train_evaluate_model(param_space)
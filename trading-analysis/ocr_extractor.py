@@ -5,7 +5,7 @@ from collections import deque
 from datetime import datetime, timedelta
 from functools import cached_property
 from pathlib import Path
-from typing import List, Tuple, TypeVar
+from typing import Hashable, List, Tuple, TypeVar
 
 import cv2
 import numpy as np
@@ -111,8 +111,9 @@ class FrameReader:
     ]
     COL_MODES = ["dt", "type", "dec", "abc", "dec"]
 
-    def __init__(self, frame: np.ndarray):
+    def __init__(self, frame: np.ndarray, frame_pos: int = -1):
         self.frame = frame
+        self.frame_pos = frame_pos
         self.table = gray_region(frame, TABLE_RANGE)
 
     @staticmethod
@@ -143,6 +144,177 @@ class FrameReader:
         return OCR.read(gray_region(self.frame, self.TIME_RANGE), "time")
 
 
+class ClockModel:
+    """On-screen clock as a function of frame_pos
+
+    A reading s at frame p says s <= a + b * p < s + 1 for the clock's
+    offset a and rate b, and b is within max_drift of 1 / fps. The accepted
+    readings bound (a, b) to a polygon whose corners give the range of
+    times any frame can have, so drift widens that range the further a
+    frame is from the readings until enough of them pin the rate down.
+
+    OCR runs until min_samples readings agree, while a frame's range
+    straddles a second boundary, every verify_every seconds of video and
+    after a reading that did not fit. A reading that does not fit is
+    dropped as a misread, unless the next one fits it but not the model:
+    then the clock jumped and the model is re-anchored on those two.
+
+    A jump is only seen at the next OCR, so predictions made since the last
+    accepted reading are kept until one is accepted. On a re-anchor each is
+    read again, and those whose reading fits the new clock but not the old
+    one join the new model and come back from revisions().
+    """
+
+    DAY = 24 * 3600
+
+    def __init__(
+        self,
+        fps: float,
+        min_samples: int = 3,
+        verify_every: float = 300,
+        max_drift: float = 0.01,
+        max_samples: int = 20,
+    ):
+        self.fps = fps
+        self.min_samples = min_samples
+        self.verify_every = verify_every
+        self.max_drift = max_drift
+        self.max_samples = max_samples
+        self.samples: List[Tuple[int, int]] = []  # readings the model is built on
+        self.pending: List[Tuple[int, int]] = []  # readings that did not fit
+        self.corners = np.empty((0, 2))
+        self.predicted: List[Tuple[Hashable, FrameReader]] = []
+        self.revised: dict = {}
+
+    @staticmethod
+    def _parse(text: str) -> int | None:
+        try:
+            t = datetime.strptime(text, "%H:%M:%S")
+        except ValueError:
+            return None
+        return t.hour * 3600 + t.minute * 60 + t.second
+
+    def _corners(self, samples: List[Tuple[int, int]]) -> np.ndarray:
+        """Corners (a, b) of the polygon the readings allow, empty if none"""
+        pos, seconds = np.array(samples, dtype=float).T
+        b0 = 1 / self.fps
+        b_min, b_max = b0 * (1 - self.max_drift), b0 * (1 + self.max_drift)
+
+        # Each reading bounds a + p * b from below and above: intersect every
+        # pair of those lines, and each line with the rate limits
+        p = np.concatenate([pos, pos])
+        c = np.concatenate([seconds, seconds + 1])
+        i, j = np.triu_indices(len(p), 1)
+        i, j = i[p[i] != p[j]], j[p[i] != p[j]]
+        pair_b = (c[i] - c[j]) / (p[i] - p[j])
+        edge_b = np.repeat([b_min, b_max], len(p))
+        a = np.concatenate(
+            [c[i] - p[i] * pair_b, np.tile(c, 2) - np.tile(p, 2) * edge_b]
+        )
+        b = np.concatenate([pair_b, edge_b])
+
+        t = a[:, None] + b[:, None] * pos
+        eps = 1e-6
+        inside = (
+            (t >= seconds - eps).all(axis=1)
+            & (t <= seconds + 1 + eps).all(axis=1)
+            & (b >= b_min * (1 - 1e-12))
+            & (b <= b_max * (1 + 1e-12))
+        )
+        return np.column_stack([a, b])[inside]
+
+    def _range(self, pos: int) -> Tuple[float, float]:
+        t = self.corners[:, 0] + self.corners[:, 1] * pos
+        return t.min(), t.max()
+
+    def _ambiguous(self, pos: int) -> bool:
+        lo, hi = self._range(pos)
+        return np.floor(lo) != np.floor(hi - 1e-6)
+
+    def _predict(self, pos: int) -> str:
+        lo, hi = self._range(pos)
+        seconds = int(np.floor(lo if not self._ambiguous(pos) else (lo + hi) / 2))
+        seconds %= self.DAY
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    def _fits(self, samples: List[Tuple[int, int]], sample: Tuple[int, int]) -> bool:
+        return self._corners((samples + [sample])[-self.max_samples :]).size > 0
+
+    def _unwrap(self, pos: int, seconds: int) -> int:
+        """Continue past midnight: pick the day closest to the expected time"""
+        if self.samples:
+            expected = sum(self._range(pos)) / 2
+        elif self.pending:
+            last_pos, last = self.pending[-1]
+            expected = last + (pos - last_pos) / self.fps
+        else:
+            return seconds
+        return seconds + round((expected - seconds) / self.DAY) * self.DAY
+
+    def _needs_sample(self, pos: int) -> bool:
+        if not self.samples or self.pending:
+            return True
+        last = max(p for p, _ in self.samples)
+        return pos - last > self.verify_every * self.fps or self._ambiguous(pos)
+
+    def add_sample(self, pos: int, text: str) -> bool:
+        """Whether the reading was accepted into the model"""
+        if (seconds := self._parse(text)) is None:
+            return False
+        sample = (pos, self._unwrap(pos, seconds))
+
+        if self.samples:
+            samples = (self.samples + [sample])[-self.max_samples :]
+            if (corners := self._corners(samples)).size:
+                self.samples, self.corners, self.pending = samples, corners, []
+                self.predicted = []
+                return True
+
+        # Two readings that agree with each other are enough to follow a jump
+        self.pending = (self.pending + [sample])[-self.min_samples :]
+        anchor = self.pending[-(2 if self.samples else self.min_samples) :]
+        if len(anchor) > 1 and (corners := self._corners(anchor)).size:
+            old = self.samples
+            self.samples, self.corners, self.pending = anchor, corners, []
+            if old:
+                print(f"時鐘與預測不符，重新定錨：{text}")
+                self._revise(old)
+            return True
+        return False
+
+    def _revise(self, old: List[Tuple[int, int]]):
+        """Re-read the predictions made on the old clock after it jumped"""
+        for key, reader in self.predicted:
+            pos = reader.frame_pos
+            if (seconds := self._parse(reader.timestamp)) is None:
+                continue
+            sample = (pos, self._unwrap(pos, seconds))
+            if self._fits(self.samples, sample) and not self._fits(old, sample):
+                self.samples = sorted(self.samples + [sample])[-self.max_samples :]
+                self.corners = self._corners(self.samples)
+                self.revised[key] = reader.timestamp
+        self.predicted = []
+
+    def revisions(self) -> dict:
+        """Times to correct since the last call, key -> HH:MM:SS"""
+        revised, self.revised = self.revised, {}
+        return revised
+
+    def timestamp(self, reader: FrameReader, key: Hashable = None) -> str:
+        """HH:MM:SS at the reader's frame, OCR only to anchor and re-verify
+
+        key names the prediction in revisions() if the clock later turns out
+        to have jumped before this frame.
+        """
+        pos = reader.frame_pos
+        if self._needs_sample(pos) and self.add_sample(pos, reader.timestamp):
+            return reader.timestamp
+        if not self.samples:
+            return reader.timestamp
+        self.predicted.append((key, reader))
+        return self._predict(pos)
+
+
 class Shot:
     y1, y2, _, _ = TABLE_RANGE
     BAR_RANGE = (y1, y2, 1060, 1063)
@@ -150,8 +322,9 @@ class Shot:
     BAR_ROW_RANGES = [(y1 + 7, y2 - 7) for y1, y2 in Y_RANGES]
     ID_ROW_RANGES = [(y1 + 3, y2 - 3) for y1, y2 in Y_RANGES]
 
-    def __init__(self, frame: np.ndarray):
+    def __init__(self, frame: np.ndarray, pos: int = -1):
         self.frame = frame
+        self.pos = pos
         self.id_img = gray_region(frame, self.ID_RANGE)
         self.bar = self._locate_bar()
 
@@ -192,24 +365,67 @@ class Shot:
 
 
 class VideoAnalyzer:
-    def __init__(self, path: str, start_pos: int = 0):
+    """Scan a recording for table changes
+
+    In follow mode EOF means "not recorded yet": reads wait for the file to
+    grow, reopening the capture at the same frame, and only give up after
+    idle_timeout seconds without new frames. After that the recording is
+    taken as ended and later reads past EOF fail at once. The recording must
+    be in a container that is readable while written (mkv, ts), not mp4.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        start_pos: int = 0,
+        follow: bool = False,
+        idle_timeout: float = 60,
+        poll_interval: float = 1,
+    ):
+        self.path = path
+        self.follow = follow
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.ended = False
         self.cap = cv2.VideoCapture(path)
         if not self.cap.isOpened():
             raise ValueError("無法開啟影片檔案")
         self.frame_pos = start_pos
         self._set_pos(start_pos)
         self.last_shot = unwrap(self._read_shot())
-        self.STEP_SIZE = int(self.cap.get(cv2.CAP_PROP_FPS))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.STEP_SIZE = int(self.fps)
 
     def __del__(self):
         self.cap.release()
 
     def _set_pos(self, pos: int):
+        self.read_pos = pos
         self.cap.set(cv2.CAP_PROP_POS_FRAMES, pos)
 
     def _read_shot(self) -> Shot | None:
         ret, frame = self.cap.read()
-        return Shot(frame) if ret else None
+        if not ret and self.follow and not self.ended:
+            ret, frame = self._wait_for_frame()
+        if not ret:
+            return None
+        self.read_pos += 1
+        return Shot(frame, self.read_pos - 1)
+
+    def _wait_for_frame(self) -> Tuple[bool, np.ndarray | None]:
+        """Reopen the growing file at read_pos until that frame exists"""
+        deadline = time.monotonic() + self.idle_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.path)
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.read_pos)
+            ret, frame = self.cap.read()
+            if ret:
+                return ret, frame
+        print(f"{self.idle_timeout} 秒沒有新畫面，停止追蹤")
+        self.ended = True
+        return False, None
 
     def _compare_shot(self, other: Shot | None = None) -> Tuple[Shot | None, bool]:
         other = other or self.last_shot
@@ -244,7 +460,7 @@ class VideoAnalyzer:
             if last_shot.is_similar(shot):
                 count += 1
                 if count > 1:
-                    self.frame_pos = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+                    self.frame_pos = self.read_pos - 1
                     self.last_shot = shot
                     return shot
             else:
@@ -255,15 +471,15 @@ class VideoAnalyzer:
     def init_frame(self) -> Tuple[np.ndarray, int]:
         return self.last_shot.frame, self.last_shot.bar
 
-    def next_change(self) -> Tuple[np.ndarray, np.ndarray | None, Tuple[int, int], int]:
+    def next_change(self) -> Tuple[Shot, Shot | None, Tuple[int, int], int]:
         save_pos = self._find_transition()
         pre_shot = self._find_pre_change()
         post_shot = self._find_post_change()
         if post_shot is None:
-            return pre_shot.frame, None, (-1, -1), save_pos
+            return pre_shot, None, (-1, -1), save_pos
         return (
-            pre_shot.frame,
-            post_shot.frame,
+            pre_shot,
+            post_shot,
             pre_shot.change_range(post_shot),
             save_pos,
         )
@@ -283,14 +499,16 @@ class TradeDataProcessor:
     ]
     END_PRICE_COL_INDEX = COLUMNS.index("End Price")
 
-    def __init__(self, video_path: str, resume_data: bool = True):
+    def __init__(self, video_path: str, resume_data: bool = True, follow: bool = False):
         name = Path(video_path).stem
         self.OUT_PATH = Path(OUTPUT_DIR / f"{name}.csv")
         self.RAW_PATH = Path(OUTPUT_DIR / f"{name}_raw.csv")
+        self.EVENTS_PATH = Path(OUTPUT_DIR / f"{name}_events.csv")
         self.df, self.frame_pos = self._load_data(resume_data)
-        self.va = VideoAnalyzer(video_path, self.frame_pos)
+        self.va = VideoAnalyzer(video_path, self.frame_pos, follow)
         frame, count = self.va.init_frame()
-        self.proc = FrameReader(frame)
+        self.proc = FrameReader(frame, self.frame_pos)
+        self.clock = ClockModel(self.va.fps)
         self.pos = [self.proc.get_id(i) for i in range(count)] if self.proc else []
         self.prev_proc = self.proc
 
@@ -306,11 +524,12 @@ class TradeDataProcessor:
 
     def _get_change(self) -> List[str] | None:
         """Extract changed order IDs from video frames, handling OCR duplicates"""
-        prev_frame, frame, (start, end), self.frame_pos = self.va.next_change()
-        if frame is None:
+        prev_shot, shot, (start, end), self.frame_pos = self.va.next_change()
+        if shot is None:
             return None
 
-        self.prev_proc, self.proc = FrameReader(prev_frame), FrameReader(frame)
+        self.prev_proc = FrameReader(prev_shot.frame, prev_shot.pos)
+        self.proc = FrameReader(shot.frame, shot.pos)
 
         while True:
             change = [self.proc.get_id(i) for i in range(start, end)]
@@ -319,24 +538,43 @@ class TradeDataProcessor:
                 return self.pos[:start] + change
 
             # OCR duplicates detected, try next frame
-            _, next_frame, (next_start, end), _ = self.va.next_change()
-            if next_frame is None:
+            _, next_shot, (next_start, end), _ = self.va.next_change()
+            if next_shot is None:
                 return None
 
-            self.proc = FrameReader(next_frame)
+            self.proc = FrameReader(next_shot.frame, next_shot.pos)
             start = min(start, next_start)
 
     def _print_row(self, idx: str):
         values = self.df.loc[idx].iloc[: self.END_PRICE_COL_INDEX]
         print(idx, *values, sep="  ")
 
+    def _append_event(self, event: str, idx: str):
+        """Append one open/close event, so readers see trades while recording"""
+        row = self.df.loc[[idx]].reset_index()
+        row.insert(0, "event", event)
+        row.to_csv(
+            self.EVENTS_PATH,
+            mode="a",
+            header=not self.EVENTS_PATH.is_file(),
+            index=False,
+            lineterminator="\n",
+        )
+
     def _update_positions(self, prev: List[str], curr: List[str]):
         for idx in [i for i in prev if i not in curr]:
             self.df.loc[idx, ["End Time", "End Price"]] = [
-                self.prev_proc.timestamp,
+                self.clock.timestamp(self.prev_proc, idx),
                 self.prev_proc.get_price(prev.index(idx)),
             ]
             self._print_row(idx)
+            self._append_event("close", idx)
+
+        for idx, end_time in self.clock.revisions().items():
+            self.df.loc[idx, "End Time"] = end_time
+            print("時鐘跳動，修正平倉時間：", end="")
+            self._print_row(idx)
+            self._append_event("revise", idx)
 
         for idx in [i for i in curr if i not in prev]:
             if idx not in self.df.index:
@@ -346,6 +584,7 @@ class TradeDataProcessor:
                     self.frame_pos,
                 ]
                 self._print_row(idx)
+                self._append_event("open", idx)
 
         self.save_output(self.RAW_PATH)
 
@@ -443,6 +682,7 @@ class TradeDataProcessor:
 if __name__ == "__main__":
     import sys
 
-    processor = TradeDataProcessor(sys.argv[1])
+    # --follow: keep extracting while the recording (mkv / ts) is still growing
+    processor = TradeDataProcessor(sys.argv[1], follow="--follow" in sys.argv[2:])
     processor.process()
     processor.save_output()
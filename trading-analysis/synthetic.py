@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+START = pd.Timestamp("2024-09-23 00:00:00")
+
+
+def make_ticks(
+    n: int,
+    seed: int = 0,
+    start: pd.Timestamp = START,
+    price: float = 143.0,
+    pip: float = 0.001,
+    calm_rate: float = 2.0,
+    burst_rate: float = 40.0,
+) -> pd.DataFrame:
+    """Synthetic ticks shaped like the Parquet files: DatetimeIndex, bid, ask
+
+    Arrivals are Poisson with a rate that switches between calm and burst
+    regimes, the bid is a random walk in whole pips and the spread widens
+    during bursts. Timestamps have microsecond resolution like the real data.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Alternate calm / burst runs of geometric length
+    burst = np.zeros(n, dtype=bool)
+    pos, in_burst = 0, False
+    while pos < n:
+        length = rng.geometric(0.05 if in_burst else 0.01)
+        burst[pos : pos + length] = in_burst
+        pos += length
+        in_burst = not in_burst
+
+    gaps = rng.exponential(1 / np.where(burst, burst_rate, calm_rate))
+    micros = np.cumsum(np.round(gaps * 1e6).astype(np.int64))
+    index = pd.DatetimeIndex(start.value + micros * 1000)
+
+    scale = round(1 / pip)
+    steps = rng.choice([-2, -1, 0, 1, 2], size=n, p=[0.1, 0.25, 0.3, 0.25, 0.1])
+    bid = round(price * scale) + np.cumsum(steps)
+    spread = rng.geometric(np.where(burst, 0.3, 0.7))
+    return pd.DataFrame(
+        {"bid": bid / scale, "ask": (bid + spread) / scale}, index=index
+    )
+
+
+def make_trades(
+    ticks: pd.DataFrame,
+    n_trades: int,
+    seed: int = 0,
+    symbol: str = "usdjpy",
+    trade_type: str = "buy",
+    min_history: int = 120,
+) -> pd.DataFrame:
+    """Synthetic trades shaped like load_data's output
+
+    Each trade is matched to a random tick with at least min_history ticks
+    before it. End Time is truncated to the second, as OCR reads it, and End
+    Price is that tick's bid (buy) or ask (sell).
+    """
+    rng = np.random.default_rng(seed)
+    price_col = "bid" if trade_type == "buy" else "ask"
+
+    n_trades = min(n_trades, len(ticks) - min_history)
+    entry = np.sort(
+        rng.choice(np.arange(min_history, len(ticks)), n_trades, replace=False)
+    )
+    opened = np.maximum(entry - rng.integers(10, 500, n_trades), 0)
+
+    return pd.DataFrame(
+        {
+            "Order": np.arange(1, n_trades + 1),
+            "Time": ticks.index[opened].floor("s"),
+            "Type": trade_type,
+            "Size": 1.0,
+            "Symbol": symbol,
+            "Price": ticks[price_col].to_numpy()[opened],
+            "End Time": ticks.index[entry].floor("s"),
+            "End Price": ticks[price_col].to_numpy()[entry],
+        }
+    )
@@ -0,0 +1,245 @@
+import argparse
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"TICKARC1"
+SUFFIX = ".ticks"
+CHUNK_ROWS = 1 << 16
+MAX_DECIMALS = 8
+INT32 = np.iinfo(np.int32)
+INT64 = np.iinfo(np.int64)
+UINT32 = np.iinfo(np.uint32)
+
+
+def price_scale(values: np.ndarray) -> int:
+    """Smallest power of ten that turns every price into an exact integer"""
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10**decimals
+        pips = np.round(values * scale)
+        if np.array_equal(pips / scale, values):
+            if pips.size and (pips.min() < INT32.min or pips.max() > INT32.max):
+                break
+            return scale
+    raise ValueError("價格無法無損轉成 int32 pip（小數位數太多或數值太大）")
+
+
+def chunk_starts(micros: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """Row where each chunk starts: every chunk_rows ticks, and wherever the
+    gap to the previous tick does not fit in a uint32 delta (~71 minutes)"""
+    gaps = np.flatnonzero(np.diff(micros) > UINT32.max) + 1
+    bounds = [0, *gaps, len(micros)]
+    return np.array(
+        [
+            row
+            for lo, hi in zip(bounds, bounds[1:])
+            for row in range(lo, hi, chunk_rows)
+        ],
+        dtype=np.int64,
+    )
+
+
+def narrow(values: np.ndarray) -> np.ndarray:
+    """Non-negative integers in the smallest unsigned dtype that holds them"""
+    return values.astype(np.min_scalar_type(int(values.max())))
+
+
+def write_archive(
+    ticks: pd.DataFrame, path: Path | str, chunk_rows: int = CHUNK_ROWS
+) -> Path:
+    """Write ticks (DatetimeIndex + price columns) as a delta-encoded archive
+
+    Layout: MAGIC, uint32 header length, JSON header, then the chunks. In
+    each chunk the time is stored as µs deltas from the previous tick and
+    every price column in pips above the chunk's lowest, each in the
+    narrowest unsigned integer that fits; the header keeps the chunk's
+    byte offset, first / last time, bases and dtypes. Raises ValueError if
+    any value would not come back exactly.
+    """
+    path = Path(path)
+    index = ticks.index
+    if not isinstance(index, pd.DatetimeIndex):
+        raise ValueError("ticks 的索引必須是 DatetimeIndex")
+    if not index.is_monotonic_increasing:
+        raise ValueError("ticks 的時間必須遞增")
+
+    nanos = index.as_unit("ns").asi8
+    if (nanos % 1000).any():
+        raise ValueError("時間精度超過微秒，無法無損儲存")
+    micros = nanos // 1000
+
+    scales, pips = {}, {}
+    for name in ticks.columns:
+        values = ticks[name].to_numpy(dtype=np.float64)
+        scales[name] = price_scale(values)
+        pips[name] = np.round(values * scales[name]).astype(np.int64)
+
+    chunks, blocks, offset = [], [], 0
+    starts = chunk_starts(micros, chunk_rows)
+    for lo, hi in zip(starts, [*starts[1:], len(micros)]):
+        time = micros[lo:hi]
+        chunk = {
+            "rows": int(hi - lo),
+            "offset": offset,
+            "first_us": int(time[0]),
+            "last_us": int(time[-1]),
+            "columns": {},
+        }
+        arrays = {"time": (int(time[0]), np.diff(time, prepend=time[0]))}
+        for name, values in pips.items():
+            base = int(values[lo:hi].min())
+            arrays[name] = (base, values[lo:hi] - base)
+        for name, (base, values) in arrays.items():
+            values = narrow(values)
+            chunk["columns"][name] = [base, values.dtype.str]
+            blocks.append(values.tobytes())
+            offset += values.nbytes
+        chunks.append(chunk)
+
+    header = json.dumps(
+        {
+            "version": 1,
+            "rows": len(ticks),
+            "index": {
+                "name": index.name,
+                "unit": index.unit,
+                "tz": str(index.tz) if index.tz else None,
+            },
+            "scales": scales,
+            "dtypes": {name: str(dtype) for name, dtype in ticks.dtypes.items()},
+            "chunks": chunks,
+        }
+    ).encode()
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        f.writelines(blocks)
+    return path
+
+
+def read_header(path: Path | str) -> tuple[dict, int]:
+    """Archive header and the byte offset of the first chunk"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是 tick 封存檔：{path}")
+        (size,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(size))
+    return header, len(MAGIC) + 4 + size
+
+
+def read_archive(
+    path: Path | str,
+    start: pd.Timestamp | str | None = None,
+    end: pd.Timestamp | str | None = None,
+) -> pd.DataFrame:
+    """Decode an archive into the same DataFrame read_parquet would return
+
+    With start / end only the chunks overlapping [start, end] are read from
+    disk (memory-mapped), then trimmed to the exact range.
+    """
+    header, data_offset = read_header(path)
+    meta, tz = header["index"], header["index"]["tz"]
+
+    def to_nanos(value) -> int:
+        value = pd.Timestamp(value)
+        if tz and value.tz is None:
+            value = value.tz_localize(tz)
+        return value.value
+
+    lo_us = INT64.min if start is None else -(-to_nanos(start) // 1000)
+    hi_us = INT64.max if end is None else to_nanos(end) // 1000
+    chunks = [
+        chunk
+        for chunk in header["chunks"]
+        if chunk["last_us"] >= lo_us and chunk["first_us"] <= hi_us
+    ]
+
+    data = (
+        np.memmap(path, dtype=np.uint8, mode="r")
+        if chunks
+        else np.zeros(0, dtype=np.uint8)
+    )
+    # Decode each chunk straight into the output arrays: cumulative deltas
+    # for the time, base + offset (then / scale, in place) for the prices
+    scales = header["scales"]
+    rows = sum(chunk["rows"] for chunk in chunks)
+    micros = np.empty(rows, dtype=np.int64)
+    prices = {name: np.empty(rows, dtype=np.float64) for name in scales}
+    row = 0
+    for chunk in chunks:
+        offset = data_offset + chunk["offset"]
+        span = slice(row, row + chunk["rows"])
+        for name in ["time", *scales]:
+            base, dtype = chunk["columns"][name]
+            count = chunk["rows"] * np.dtype(dtype).itemsize
+            values = data[offset : offset + count].view(dtype)
+            offset += count
+            if name == "time":
+                np.cumsum(values, dtype=np.int64, out=micros[span])
+                micros[span] += base
+            else:
+                np.add(values, np.float64(base), out=prices[name][span])
+        row += chunk["rows"]
+    for name, scale in scales.items():
+        prices[name] /= scale
+
+    unit = f"datetime64[{meta['unit']}]"
+    index = pd.DatetimeIndex(
+        micros.astype("datetime64[us]").astype(unit), name=meta["name"]
+    )
+    if tz:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    ticks = pd.DataFrame(
+        {
+            name: values.astype(header["dtypes"][name], copy=False)
+            for name, values in prices.items()
+        },
+        index=index,
+    )
+    if start is None and end is None:
+        return ticks
+    lo = np.searchsorted(micros, lo_us)
+    hi = np.searchsorted(micros, hi_us, side="right")
+    return ticks.iloc[lo:hi]
+
+
+def parquet_to_archive(src: Path | str, dst: Path | str | None = None) -> Path:
+    """Convert a tick Parquet file and check it reads back identical"""
+    src = Path(src)
+    dst = Path(dst) if dst else src.with_suffix(SUFFIX)
+    ticks = pd.read_parquet(src)
+    write_archive(ticks, dst)
+    pd.testing.assert_frame_equal(read_archive(dst), ticks, check_freq=False)
+    return dst
+
+
+def archive_to_parquet(src: Path | str, dst: Path | str | None = None) -> Path:
+    src = Path(src)
+    dst = Path(dst) if dst else src.with_suffix(".parquet")
+    read_archive(src).to_parquet(dst)
+    return dst
+
+
+def load_ticks(stem: Path | str) -> pd.DataFrame:
+    """{stem}.ticks if it has been converted, otherwise {stem}.parquet"""
+    stem = Path(stem)
+    if (archive := stem.with_suffix(SUFFIX)).is_file():
+        return read_archive(archive)
+    return pd.read_parquet(stem.with_suffix(".parquet"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parquet <-> tick archive")
+    parser.add_argument("files", nargs="+", type=Path, help=".parquet 或 .ticks")
+    args = parser.parse_args()
+
+    for src in args.files:
+        if src.suffix == SUFFIX:
+            dst = archive_to_parquet(src)
+        else:
+            dst = parquet_to_archive(src)
+        ratio = dst.stat().st_size / src.stat().st_size
+        print(f"{src.name} -> {dst.name}（大小 {ratio:.0%}）")
@@ -1,88 +1,353 @@
-import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 import ipywidgets as widgets
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from tick_archive import load_ticks
+from tick_visualizer import build_trade_index, entry_exit_segments
+
 DATA_DIR = Path("../data")
+POINT_BUDGET = 4000  # points per trace before switching to WebGL + downsampling
 
 
 def load_data(
     symbol: str = "usdjpy", trade_type: str = "buy"
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     """載入交易資料和tick資料"""
-    trades = pd.read_csv(DATA_DIR / "20240923.csv").dropna()
-    trades["Type"] = trades["Type"].str.strip()
-    trades = (
-        trades[(trades["Symbol"] == symbol) & (trades["Type"] == trade_type)]
-        .iloc[1:]
-        .drop(columns="frame_pos")
-        .reset_index(drop=True)
+    trades_dict, ticks_dict = load_symbols([symbol], trade_type)
+    return trades_dict[symbol], ticks_dict[symbol]
+
+
+def load_symbols(
+    symbols: list[str], trade_type: str = "buy"
+) -> tuple[dict[str, pd.DataFrame], dict[str, pd.DataFrame]]:
+    """一次解析交易 CSV 再依品種切分，各品種 tick 檔平行讀取"""
+    with ThreadPoolExecutor(max_workers=len(symbols)) as pool:
+        tick_futures = {
+            symbol: pool.submit(load_ticks, DATA_DIR / f"{symbol.upper()}_20240923")
+            for symbol in symbols
+        }
+
+        trades = pd.read_csv(DATA_DIR / "20240923.csv").dropna()
+        trades["Type"] = trades["Type"].str.strip()
+        trades = trades[
+            trades["Symbol"].isin(symbols) & (trades["Type"] == trade_type)
+        ].drop(columns="frame_pos")
+        trades[["Time", "End Time"]] = trades[["Time", "End Time"]].apply(
+            pd.to_datetime
+        )
+        grouped = dict(tuple(trades.groupby("Symbol", sort=False)))
+        trades_dict = {
+            symbol: grouped.get(symbol, trades.iloc[:0]).iloc[1:].reset_index(drop=True)
+            for symbol in symbols
+        }
+
+        ticks_dict = {
+            symbol: future.result() for symbol, future in tick_futures.items()
+        }
+    return trades_dict, ticks_dict
+
+
+def downsample_minmax(
+    x: np.ndarray, y: np.ndarray, budget: int = POINT_BUDGET
+) -> tuple[np.ndarray, np.ndarray]:
+    """Keep first/min/max/last of each bucket, in order, up to budget points
+
+    Every extreme survives, so an hv step line keeps its envelope, and each
+    bucket's last tick still holds until the next bucket's first.
+    """
+    n = len(y)
+    if n <= budget:
+        return x, y
+
+    size = -(-n // (budget // 4))  # ticks per bucket
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+    missing = np.isnan(padded)  # padding, or no quote yet in the panel
+
+    base = np.arange(n_buckets) * size
+    keep = np.concatenate(
+        [
+            base,
+            base + np.where(missing, np.inf, padded).argmin(axis=1),
+            base + np.where(missing, -np.inf, padded).argmax(axis=1),
+            np.minimum(base + size, n) - 1,
+        ]
     )
-    trades[["Time", "End Time"]] = trades[["Time", "End Time"]].apply(pd.to_datetime)
-    ticks = pd.read_parquet(DATA_DIR / f"{symbol.upper()}_20240923.parquet")
-    return trades, ticks
+    keep = np.unique(keep)
+    return x[keep], y[keep]
+
+
+def build_aligned_panel(ticks_dict: dict[str, pd.DataFrame]) -> dict:
+    """As-of join every symbol onto the union of all tick timestamps
+
+    time is (n,), bid/ask are (n, n_symbols) C-contiguous arrays where each
+    column holds that symbol's latest quote at each time (NaN before its
+    first tick), so one row slice is a synchronized window of all symbols.
+    """
+    times = np.unique(np.concatenate([t.index.to_numpy() for t in ticks_dict.values()]))
+    bid = np.full((len(times), len(ticks_dict)), np.nan)
+    ask = np.full((len(times), len(ticks_dict)), np.nan)
+
+    for j, ticks in enumerate(ticks_dict.values()):
+        pos = ticks.index.to_numpy().searchsorted(times, side="right") - 1
+        valid = pos >= 0
+        bid[valid, j] = ticks["bid"].to_numpy()[pos[valid]]
+        ask[valid, j] = ticks["ask"].to_numpy()[pos[valid]]
+
+    return {"symbols": list(ticks_dict), "time": times, "bid": bid, "ask": ask}
+
+
+def panel_window(panel: dict, start, end, pad: int = 0) -> dict:
+    """[start, end] of all symbols as one slice; pad keeps earlier rows too"""
+    times = panel["time"]
+    lo = max(times.searchsorted(np.datetime64(start)) - pad, 0)
+    hi = times.searchsorted(np.datetime64(end), side="right")
+    return {
+        "symbols": panel["symbols"],
+        "time": times[lo:hi],
+        "bid": panel["bid"][lo:hi],
+        "ask": panel["ask"][lo:hi],
+    }
+
 
+def tick_window(
+    ticks: pd.DataFrame, times: np.ndarray, start, end, pad: int = 0
+) -> pd.DataFrame:
+    """[start, end] of one symbol's own ticks (times is its sorted index)"""
+    lo = max(times.searchsorted(np.datetime64(start)) - pad, 0)
+    hi = times.searchsorted(np.datetime64(end), side="right")
+    return ticks.iloc[lo:hi]
 
-def plot_tick_data(fig: go.Figure, ticks: pd.DataFrame, row: int, col: int):
-    """繪製tick資料"""
-    for price_type, color, opacity in [
-        ("ask", "green", 0.2),
-        ("bid", "red", 1.0),
-    ]:
+
+def lead_lag(
+    window: dict,
+    bucket: pd.Timedelta = pd.Timedelta(milliseconds=100),
+    max_lag: int = 20,
+) -> pd.DataFrame:
+    """Correlation of the first symbol's mid returns with every symbol's, by lag
+
+    Mids are sampled as-of on a regular bucket grid. A peak at a positive lag
+    means the first symbol moves before that symbol.
+    """
+    times = window["time"]
+    if len(times) < 2:
+        return pd.DataFrame(columns=window["symbols"], dtype=float)
+
+    grid = np.arange(times[0], times[-1], bucket.to_timedelta64())
+    pos = times.searchsorted(grid, side="right") - 1
+    mid = (window["bid"][pos] + window["ask"][pos]) / 2
+    returns = np.diff(mid, axis=0)
+
+    std = returns.std(axis=0)
+    std[std == 0] = np.nan
+    z = (returns - returns.mean(axis=0)) / std
+
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr = np.full((len(lags), z.shape[1]), np.nan)
+    for k, lag in enumerate(lags):
+        if abs(lag) >= len(z):
+            continue
+        lead = z[: len(z) - lag, 0] if lag >= 0 else z[-lag:, 0]
+        follow = z[lag:] if lag >= 0 else z[: len(z) + lag]
+        corr[k] = np.nanmean(lead[:, None] * follow, axis=0)
+
+    return pd.DataFrame(
+        corr, index=pd.Index(lags * bucket, name="lag"), columns=window["symbols"]
+    )
+
+
+def lead_lag_summary(corr: pd.DataFrame) -> str:
+    """Strongest lag per symbol against the first one, for the chart title"""
+    parts = []
+    for symbol in corr.columns[1:]:
+        column = corr[symbol].dropna()
+        if column.empty:
+            continue
+        lag = column.abs().idxmax()
+        ms = int(lag / pd.Timedelta(milliseconds=1))
+        parts.append(f"{symbol.upper()} {ms:+d}ms ρ={column[lag]:.2f}")
+    return " | ".join(parts)
+
+
+def tick_data(
+    ticks: pd.DataFrame, budget: int = POINT_BUDGET
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Ask / Bid 的 x/y（超過點數上限時降採樣）"""
+    return {
+        price_type: downsample_minmax(
+            ticks.index.to_numpy(), ticks[price_type].to_numpy(), budget
+        )
+        for price_type in ["ask", "bid"]
+    }
+
+
+def init_traces(fig: go.Figure, row: int, col: int = 1) -> dict:
+    """建立一個品種固定的 trace：SVG 與 WebGL 的 Ask/Bid 各一組、進場點、出場點
+
+    WebGL 那組只在窗口超過點數上限時顯示，另一組隱藏並清空。
+    """
+    for scatter in [go.Scatter, go.Scattergl]:
+        for price_type, color, opacity in [
+            ("ask", "green", 0.2),
+            ("bid", "red", 1.0),
+        ]:
+            fig.add_trace(
+                scatter(
+                    mode="lines",
+                    name=price_type.capitalize(),
+                    line=dict(color=color, shape="hv"),
+                    opacity=opacity,
+                    visible=scatter is go.Scatter,
+                ),
+                row=row,
+                col=col,
+            )
+    for price_col, color in [("Price", "gray"), ("End Price", "blue")]:
         fig.add_trace(
             go.Scatter(
-                x=ticks.index,
-                y=ticks[price_type],
                 mode="lines",
-                name=price_type.capitalize(),
-                line=dict(color=color, shape="hv"),
-                opacity=opacity,
+                name=price_col,
+                line=dict(color=color, dash="dash"),
             ),
             row=row,
             col=col,
         )
-    return
+    svg_ask, svg_bid, gl_ask, gl_bid, entries, exits = fig.data[-6:]
+    return {
+        "svg": (svg_ask, svg_bid),
+        "gl": (gl_ask, gl_bid),
+        "entry": entries,
+        "exit": exits,
+    }
 
 
-def plot_entry_exit(
-    fig: go.Figure,
-    trades: pd.DataFrame,
-    start: pd.Timestamp,
-    end: pd.Timestamp,
-    row: int,
-    col: int,
-    is_exit: bool = False,
-):
-    """繪製交易的進入/退出點"""
-    col_name = "End Time" if is_exit else "Time"
-    price_col = "End Price" if is_exit else "Price"
-    color = "blue" if is_exit else "gray"
-
-    t = trades[(trades[col_name] >= start) & (trades[col_name] < end)]
-    if not t.empty:
-        for _, row_data in t.iterrows():
-            x = row_data[col_name]
-            fig.add_trace(
-                go.Scatter(
-                    x=[x, x + pd.Timedelta(seconds=1)],
-                    y=[row_data[price_col], row_data[price_col]],
-                    mode="lines",
-                    name=price_col,
-                    line=dict(color=color, dash="dash"),
-                ),
-                row=row,
-                col=col,
+def update_traces(traces: dict, data: dict) -> tuple:
+    """就地更新一個品種固定 trace 的 x/y，傳回正在顯示的 Ask/Bid"""
+    for kind in ["svg", "gl"]:
+        shown = kind == data["kind"]
+        for trace, price_type in zip(traces[kind], ["ask", "bid"]):
+            x, y = data[price_type] if shown else ([], [])
+            trace.update(x=x, y=y, visible=shown)
+    for key in ["entry", "exit"]:
+        x, y = data[key]
+        traces[key].update(x=x, y=y)
+    return traces[data["kind"]]
+
+
+class MultiSymbolBrowser:
+    """What create_interactive_view does on each click / zoom, without widgets
+
+    fig has one row per symbol (as built by make_subplots) with a fixed set
+    of traces each; show() updates them in place around a trade of the first
+    symbol, zoom() re-slices the visible range at full resolution. Windows
+    are cached per (idx, seconds) and the neighbouring trades are computed
+    in the background. Works on a plain go.Figure, so it can be driven
+    headless.
+    """
+
+    def __init__(
+        self,
+        fig: go.Figure,
+        trades_dict: dict[str, pd.DataFrame],
+        ticks_dict: dict[str, pd.DataFrame],
+        cache_size: int = 256,
+    ):
+        self.fig = fig
+        self.trades_dict = trades_dict
+        # Use first symbol's trades as reference for all symbols
+        self.primary_trades = list(trades_dict.values())[0]
+        self.trade_indexes = {
+            symbol: build_trade_index(trades) for symbol, trades in trades_dict.items()
+        }
+        self.ticks = {symbol: ticks_dict[symbol] for symbol in trades_dict}
+        self.tick_times = {
+            symbol: ticks.index.to_numpy() for symbol, ticks in self.ticks.items()
+        }
+        # Only for lead_lag: the panel repeats every quote at other symbols' ticks
+        self.panel = build_aligned_panel(self.ticks)
+        self.window = lru_cache(maxsize=cache_size)(self._window)
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
+        self.prefetched: list[Future] = []
+
+        self.traces = {}
+        for i, symbol in enumerate(trades_dict, start=1):
+            self.traces[symbol] = init_traces(fig, row=i)
+            fig.update_yaxes(title_text=f"{symbol.upper()} Price", row=i, col=1)
+        self.tick_traces = {}  # symbol -> (ask trace, bid trace) being shown
+        self.updating = {"active": False, "range": None}
+
+    def _ticks(self, symbol: str, start, end, pad: int = 0) -> pd.DataFrame:
+        return tick_window(self.ticks[symbol], self.tick_times[symbol], start, end, pad)
+
+    def _window(self, idx: int, seconds: int) -> dict:
+        """Every symbol's traces and the lead/lag summary for one view"""
+        x = self.primary_trades.iloc[idx]["End Time"]
+        start = x - pd.Timedelta(seconds=seconds)
+        end = x + pd.Timedelta(seconds=1)
+
+        symbols = {}
+        for symbol, trade_index in self.trade_indexes.items():
+            tick_slice = self._ticks(symbol, start, end)
+            symbols[symbol] = {
+                "kind": "gl" if len(tick_slice) > POINT_BUDGET else "svg",
+                **tick_data(tick_slice),
+                "entry": entry_exit_segments(trade_index, start, end, is_exit=False),
+                "exit": entry_exit_segments(trade_index, start, end, is_exit=True),
+            }
+        window = panel_window(self.panel, start, end)
+        return {"symbols": symbols, "summary": lead_lag_summary(lead_lag(window))}
+
+    def show(self, idx: int, seconds: int):
+        """Trade idx with a window of seconds before its end time"""
+        data = self.window(idx, seconds)
+
+        self.updating.update(active=True, range=None)
+        with self.fig.batch_update():
+            for symbol, traces in self.traces.items():
+                self.tick_traces[symbol] = update_traces(
+                    traces, data["symbols"][symbol]
+                )
+            self.fig.update_layout(
+                title=f"Trade Analysis: {idx}<br><sup>{data['summary']}</sup>",
+                hovermode="x unified",
+                hoverdistance=100,
             )
-    return
+        self.updating["active"] = False
+
+        self.prefetched = [
+            self.prefetcher.submit(self.window, neighbour, seconds)
+            for neighbour in [idx + 1, idx - 1]
+            if 0 <= neighbour < len(self.primary_trades)
+        ]
+
+    def zoom(self, x_range):
+        """Re-slice the visible range at full resolution (up to the budget)"""
+        # Shared x axes report the same zoom once per subplot
+        if self.updating["active"] or not x_range or x_range == self.updating["range"]:
+            return
+        self.updating["range"] = x_range
+        start, end = (pd.Timestamp(x) for x in x_range)
+        with self.fig.batch_update():
+            for symbol, traces in self.tick_traces.items():
+                # pad: the last tick before the range still holds at its left edge
+                data = tick_data(self._ticks(symbol, start, end, pad=1))
+                for trace, price_type in zip(traces, ["ask", "bid"]):
+                    trace.update(x=data[price_type][0], y=data[price_type][1])
 
 
 def create_interactive_view(
     trades_dict: dict[str, pd.DataFrame],
     ticks_dict: dict[str, pd.DataFrame],
     idx: int = 0,
+    cache_size: int = 256,
 ):
     """Create multi-symbol synchronized view for trade correlation analysis"""
     i_input = widgets.IntText(description="i:", value=idx)
@@ -102,54 +367,20 @@ def create_interactive_view(
     )
     fig_widget = go.FigureWidget(fig)
     fig_widget.update_layout(height=300 * len(trades_dict))
+    browser = MultiSymbolBrowser(fig_widget, trades_dict, ticks_dict, cache_size)
 
     def update_plot(idx: int):
         i_input.value = idx
-        with fig_widget.batch_update():
-            fig_widget.data = []
-
-            # Use first symbol's trade time as reference for all symbols
-            primary_trades = list(trades_dict.values())[0]
-            trade = primary_trades.iloc[idx]
-            x = trade["End Time"]
-            start = x - pd.Timedelta(seconds=window_slider.value)
-            end = x + pd.Timedelta(seconds=1)
-
-            for i, (symbol, trades) in enumerate(trades_dict.items(), start=1):
-                tick_slice = ticks_dict[symbol][start:end]
-
-                plot_tick_data(fig_widget, tick_slice, row=i, col=1)
-                plot_entry_exit(
-                    fig_widget, trades, start, end, row=i, col=1, is_exit=False
-                )
-                plot_entry_exit(
-                    fig_widget, trades, start, end, row=i, col=1, is_exit=True
-                )
+        browser.show(idx, window_slider.value)
 
-                fig_widget.update_yaxes(
-                    title_text=f"{symbol.upper()} Price", row=i, col=1
-                )
+    for axis in fig_widget.select_xaxes():
+        axis.on_change(lambda _, x_range: browser.zoom(x_range), "range")
 
-            fig_widget.update_layout(
-                title=f"Trade Analysis: {idx}",
-                hovermode="x unified",
-                hoverdistance=100,
-            )
+    def step(x: int):
+        update_plot(max(0, min(len(browser.primary_trades) - 1, i_input.value + x)))
 
-    last_update = {"time": 0}
-    throttle_delay = 0.2
-
-    def throttled_update(x: int):
-        current = time.time()
-        if current - last_update["time"] > throttle_delay:
-            new_idx = max(
-                0, min(len(list(trades_dict.values())[0]) - 1, i_input.value + x)
-            )
-            update_plot(new_idx)
-            last_update["time"] = current
-
-    button_prev.on_click(lambda _: throttled_update(-1))
-    button_next.on_click(lambda _: throttled_update(1))
+    button_prev.on_click(lambda _: step(-1))
+    button_next.on_click(lambda _: step(1))
     window_slider.observe(lambda _: update_plot(i_input.value), names="value")
 
     controls = widgets.HBox(
@@ -163,17 +394,12 @@ def create_interactive_view(
     return
 
 
-symbols = [
-    "usdjpy",
-    "eurjpy",
-    "xauusd",
-]
-
-trades_dict = {}
-ticks_dict = {}
-for symbol in symbols:
-    trades, ticks = load_data(symbol=symbol)
-    trades_dict[symbol] = trades
-    ticks_dict[symbol] = ticks
+if __name__ == "__main__":
+    symbols = [
+        "usdjpy",
+        "eurjpy",
+        "xauusd",
+    ]
 
-create_interactive_view(trades_dict, ticks_dict, idx=0)
+    trades_dict, ticks_dict = load_symbols(symbols)
+    create_interactive_view(trades_dict, ticks_dict, idx=0)
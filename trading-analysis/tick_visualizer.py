@@ -1,35 +1,46 @@
-import time
+import base64
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from string import Template
 
 import ipywidgets as widgets
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
 from plotly.subplots import make_subplots
 
+from tick_archive import load_ticks
+
 DATA_DIR = Path("../data")
 
 
+def load_trades(path: Path = DATA_DIR / "20240923.csv") -> pd.DataFrame:
+    """載入所有品種的交易，Symbol / Type 為 category，時間為 datetime64"""
+    trades = pd.read_csv(path).dropna().drop(columns="frame_pos")
+    trades["Type"] = trades["Type"].str.strip()
+    trades[["Time", "End Time"]] = trades[["Time", "End Time"]].apply(pd.to_datetime)
+    return trades.astype({"Symbol": "category", "Type": "category"})
+
+
 def load_data(
     symbol: str = "usdjpy", trade_type: str = "buy"
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     """載入交易資料和tick資料"""
-    trades = pd.read_csv(DATA_DIR / "20240923.csv").dropna()
-    trades["Type"] = trades["Type"].str.strip()
+    trades = load_trades()
     trades = (
         trades[(trades["Symbol"] == symbol) & (trades["Type"] == trade_type)]
         .iloc[1:]
-        .drop(columns="frame_pos")
         .reset_index(drop=True)
     )
-    trades[["Time", "End Time"]] = trades[["Time", "End Time"]].apply(pd.to_datetime)
-    ticks = pd.read_parquet(DATA_DIR / f"{symbol.upper()}_20240923.parquet")
+    ticks = load_ticks(DATA_DIR / f"{symbol.upper()}_20240923")
     return trades, ticks
 
 
-def get_pretrade_ticks(
-    trade: pd.Series, ticks: pd.DataFrame, lookback: int = 100
-) -> pd.DataFrame:
-    """Get N ticks before trade, handling timing edge cases"""
+def match_entry_tick(trade: pd.Series, ticks: pd.DataFrame) -> pd.Series:
+    """Find the tick the trade was filled at, handling timing edge cases"""
     trade_time = trade["End Time"]
     next_second = trade_time + pd.Timedelta(seconds=1)
     price_col = "bid" if trade["Type"] == "buy" else "ask"
@@ -69,76 +80,370 @@ def get_pretrade_ticks(
                 tick = closest
             else:
                 tick = ticks[:closest_idx].iloc[-1]
+    return tick
+
 
+def get_pretrade_ticks(
+    trade: pd.Series, ticks: pd.DataFrame, lookback: int = 100
+) -> pd.DataFrame:
+    """Get N ticks before trade, handling timing edge cases"""
+    tick = match_entry_tick(trade, ticks)
     history = ticks[: tick.name].tail(lookback - 1)
     return pd.concat([history, tick.to_frame().T])
 
 
-def analyze_time_distribution(trades: pd.DataFrame):
-    """分析交易時間分佈"""
-    for dim, func in {
-        "星期": lambda x: x.dt.day_name(),
-        "小時": lambda x: x.dt.hour,
-        "分鐘": lambda x: x.dt.minute,
-        "秒": lambda x: x.dt.second,
-    }.items():
-        counts = func(trades["End Time"]).value_counts()
-        total = len(trades)
+TIME_DIMENSIONS = {
+    "星期": lambda x: x.dt.day_name(),
+    "小時": lambda x: x.dt.hour,
+    "分鐘": lambda x: x.dt.minute,
+    "秒": lambda x: x.dt.second,
+}
+
+
+class TradeTimeCube:
+    """交易次數的多維直方圖：品種 × 方向 × 星期 × 小時 × 分鐘 × 秒
+
+    建立時用一次 bincount 分箱，之後的邊際分佈和交叉表都從 cube 加總，
+    每種維度組合只算一次。
+    """
+
+    WEEKDAYS = pd.Index(
+        ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    )
+    TIME_AXES = {
+        "星期": WEEKDAYS,
+        "小時": range(24),
+        "分鐘": range(60),
+        "秒": range(60),
+    }
+
+    def __init__(self, trades: pd.DataFrame, time_col: str = "End Time"):
+        symbol = trades["Symbol"].astype("category")
+        trade_type = trades["Type"].astype("category")
+        t = trades[time_col].dt
+
+        self.labels = {
+            "Symbol": symbol.cat.categories,
+            "Type": trade_type.cat.categories,
+            **{dim: pd.Index(labels) for dim, labels in self.TIME_AXES.items()},
+        }
+        self.dims = list(self.labels)
+        shape = tuple(len(labels) for labels in self.labels.values())
+        keys = [
+            symbol.cat.codes,
+            trade_type.cat.codes,
+            t.weekday,
+            t.hour,
+            t.minute,
+            t.second,
+        ]
+        flat = np.ravel_multi_index(
+            [np.asarray(k, dtype=np.int64) for k in keys], shape
+        )
+        self.cube = np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
+        self.total = len(trades)
+        self._cache = {}
+
+    def counts(self, *dims: str) -> pd.Series:
+        """指定維度的次數，其餘維度加總；索引依 dims 的順序"""
+        if dims not in self._cache:
+            axes = [self.dims.index(dim) for dim in dims]
+            other = tuple(i for i in range(len(self.dims)) if i not in axes)
+            summed = self.cube.sum(axis=other).transpose(np.argsort(np.argsort(axes)))
+            if len(dims) == 1:
+                index = self.labels[dims[0]].rename(dims[0])
+            else:
+                index = pd.MultiIndex.from_product(
+                    [self.labels[dim] for dim in dims], names=dims
+                )
+            self._cache[dims] = pd.Series(summed.ravel(), index=index, name="count")
+        return self._cache[dims]
 
+    def crosstab(self, rows: str | list[str], columns: str | list[str]) -> pd.DataFrame:
+        """交叉表，例如 crosstab("小時", ["Symbol", "Type"])"""
+        rows = [rows] if isinstance(rows, str) else rows
+        columns = [columns] if isinstance(columns, str) else columns
+        return self.counts(*rows, *columns).unstack(columns)
+
+    def top(self, dim: str, n: int = 5) -> pd.Series:
+        """次數最多的前 n 個值"""
+        counts = self.counts(dim)
+        return counts[counts > 0].sort_values(ascending=False, kind="stable").head(n)
+
+
+def analyze_time_distribution(trades: pd.DataFrame | TradeTimeCube) -> TradeTimeCube:
+    """分析交易時間分佈"""
+    cube = trades if isinstance(trades, TradeTimeCube) else TradeTimeCube(trades)
+    for dim in TradeTimeCube.TIME_AXES:
         print(f"\n{dim}維度 Top 5 (佔比)：")
-        for value, count in counts.head().items():
-            print(f"{value}: {count}次 ({count/total*100:.1f}%)")
-    return
+        for value, count in cube.top(dim).items():
+            print(f"{value}: {count}次 ({count/cube.total*100:.1f}%)")
+    return cube
+
+
+def match_entry_positions(trades: pd.DataFrame, ticks: pd.DataFrame) -> np.ndarray:
+    """每筆交易匹配到的進場 tick 在 ticks 中的位置"""
+    times = ticks.index
+    return np.array(
+        [
+            times.searchsorted(match_entry_tick(trade, ticks).name, side="right") - 1
+            for _, trade in trades.iterrows()
+        ],
+        dtype=np.int64,
+    )
+
+
+def event_study(
+    trades: pd.DataFrame,
+    ticks: pd.DataFrame,
+    k_before: int = 100,
+    k_after: int = 50,
+    bucket: pd.Timedelta | None = None,
+    entry_pos: np.ndarray | None = None,
+) -> pd.DataFrame:
+    """所有交易進場前後的中間價路徑，相對於進場 tick
+
+    回傳 (交易數, k_before + k_after + 1) 的矩陣，欄位是相對進場的位移。
+    bucket 為 None 時以 tick 序號對齊；否則以固定時間桶對齊，每格取該時間
+    點當下（as-of）的報價。超出資料範圍的格子為 NaN。
+    """
+    if entry_pos is None:
+        entry_pos = match_entry_positions(trades, ticks)
+    mid = ((ticks["bid"] + ticks["ask"]) / 2).to_numpy()
+    offsets = np.arange(-k_before, k_after + 1)
+
+    if bucket is None:
+        pos = entry_pos[:, None] + offsets
+        valid = (pos >= 0) & (pos < len(mid))
+        columns = pd.Index(offsets, name="tick")
+    else:
+        times = ticks.index.to_numpy()
+        grid = times[entry_pos][:, None] + offsets * bucket.to_timedelta64()
+        pos = times.searchsorted(grid.ravel(), side="right").reshape(grid.shape) - 1
+        valid = (pos >= 0) & (grid <= times[-1])
+        columns = pd.TimedeltaIndex(offsets * bucket, name="time")
+
+    paths = np.where(valid, mid[pos.clip(0, len(mid) - 1)], np.nan)
+    paths -= mid[entry_pos][:, None]
+    return pd.DataFrame(paths, index=trades.index, columns=columns)
+
+
+def aggregate_event_study(
+    paths: pd.DataFrame,
+    trades: pd.DataFrame,
+    dim: str = "小時",
+    quantiles: tuple[float, ...] = (0.25, 0.5, 0.75),
+) -> pd.DataFrame:
+    """依 TIME_DIMENSIONS 的維度分組，計算平均與分位數路徑
+
+    索引為 (分組值, 統計量)，統計量包含 count、mean 與各分位數。
+    """
+    key = TIME_DIMENSIONS[dim](trades.loc[paths.index, "End Time"]).rename(dim)
+    groups = paths.groupby(key)
+    stats = {"count": groups.count(), "mean": groups.mean()}
+    stats.update({f"q{q:g}": groups.quantile(q) for q in quantiles})
+    return (
+        pd.concat(stats, names=["stat"])
+        .swaplevel()
+        .sort_index(level=0, sort_remaining=False)
+    )
+
+
+def plot_event_study(summary: pd.DataFrame, band: tuple[str, str] = ("q0.25", "q0.75")):
+    """每組一條平均路徑，加上分位數區間"""
+    fig = go.Figure()
+    for i, (value, group) in enumerate(summary.groupby(level=0, sort=False)):
+        group = group.droplevel(0)
+        x = group.columns
+        x = x.total_seconds() if isinstance(x, pd.TimedeltaIndex) else x
+        color = f"hsl({i * 360 // summary.index.levels[0].size}, 60%, 45%)"
+        fig.add_trace(
+            go.Scatter(
+                x=np.concatenate([x, x[::-1]]),
+                y=np.concatenate(
+                    [group.loc[band[1]].to_numpy(), group.loc[band[0]].to_numpy()[::-1]]
+                ),
+                fill="toself",
+                fillcolor=color,
+                opacity=0.15,
+                line=dict(width=0),
+                legendgroup=str(value),
+                showlegend=False,
+                hoverinfo="skip",
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=group.loc["mean"],
+                mode="lines",
+                name=str(value),
+                line=dict(color=color),
+                legendgroup=str(value),
+            )
+        )
+    fig.add_vline(x=0, line=dict(color="gray", dash="dash"))
+    fig.update_layout(
+        title="Event Study: Mid Price Around Entry",
+        xaxis_title="Seconds" if summary.columns.name == "time" else "Tick Offset",
+        yaxis_title="Mid - Entry Mid",
+        height=600,
+    )
+    return fig
+
 
+def build_trade_index(trades: pd.DataFrame) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """進出場時間各排序一次，之後用 searchsorted 查詢窗口"""
+    index = {}
+    for key, col, price_col in [
+        ("entry", "Time", "Price"),
+        ("exit", "End Time", "End Price"),
+    ]:
+        t = trades[[col, price_col]].dropna().sort_values(col, kind="stable")
+        index[key] = (t[col].to_numpy(), t[price_col].to_numpy())
+    return index
 
-def plot_tick_data(fig: go.Figure, ticks: pd.DataFrame):
-    """繪製tick資料"""
+
+def entry_exit_segments(
+    trade_index: dict[str, tuple[np.ndarray, np.ndarray]],
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    is_exit: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """窗口內所有進入/退出點，合併成一條以 None 分隔的線段"""
+    times, prices = trade_index["exit" if is_exit else "entry"]
+    lo, hi = times.searchsorted([np.datetime64(start), np.datetime64(end)])
+    times, prices = times[lo:hi], prices[lo:hi]
+
+    x = np.full(3 * len(times), None, dtype=object)
+    y = np.full(3 * len(times), None, dtype=object)
+    # Timestamps, not datetime64: numpy would store those as integer ns
+    times = pd.DatetimeIndex(times)
+    x[0::3], x[1::3] = list(times), list(times + pd.Timedelta(seconds=1))
+    y[0::3], y[1::3] = prices, prices
+    return x, y
+
+
+def compute_window(
+    trades: pd.DataFrame,
+    ticks: pd.DataFrame,
+    trade_index: dict[str, tuple[np.ndarray, np.ndarray]],
+    idx: int,
+    mode: str,
+) -> dict:
+    """計算單筆交易在 Time / Tick 模式下要顯示的資料"""
+    trade = trades.iloc[idx]
+
+    if mode == "Time":
+        x = trade["End Time"]
+        start = x - pd.Timedelta(seconds=10)
+        end = x + pd.Timedelta(seconds=1)
+        tick_slice = ticks[start:end]
+        return {
+            "x": tick_slice.index,
+            "ask": tick_slice["ask"].to_numpy(),
+            "bid": tick_slice["bid"].to_numpy(),
+            "entry": entry_exit_segments(trade_index, start, end, is_exit=False),
+            "exit": entry_exit_segments(trade_index, start, end, is_exit=True),
+        }
+
+    tick_slice = get_pretrade_ticks(trade, ticks, lookback=100)
+    return {
+        "x": np.arange(len(tick_slice)),
+        "ask": tick_slice["ask"].to_numpy(),
+        "bid": tick_slice["bid"].to_numpy(),
+        "entry": ([], []),
+        "exit": ([], []),
+    }
+
+
+def init_traces(fig: go.Figure):
+    """建立固定的 trace：Ask、Bid、進場點、出場點"""
     for price_type, color, opacity in [
         ("ask", "green", 0.2),
         ("bid", "red", 1.0),
     ]:
         fig.add_trace(
             go.Scatter(
-                x=ticks.index,
-                y=ticks[price_type],
                 mode="lines",
                 name=price_type.capitalize(),
                 line=dict(color=color, shape="hv"),
                 opacity=opacity,
             )
         )
+    for price_col, color in [("Price", "gray"), ("End Price", "blue")]:
+        fig.add_trace(
+            go.Scatter(
+                mode="lines",
+                name=price_col,
+                line=dict(color=color, dash="dash"),
+            )
+        )
     return
 
 
-def plot_entry_exit(
-    fig: go.Figure,
-    trades: pd.DataFrame,
-    start: pd.Timestamp,
-    end: pd.Timestamp,
-    is_exit: bool = False,
-):
-    """繪製交易的進入/退出點"""
-    col = "End Time" if is_exit else "Time"
-    price_col = "End Price" if is_exit else "Price"
-    color = "blue" if is_exit else "gray"
-
-    t = trades[(trades[col] >= start) & (trades[col] < end)]
-    if not t.empty:
-        for _, row in t.iterrows():
-            x = row[col]
-            fig.add_trace(
-                go.Scatter(
-                    x=[x, x + pd.Timedelta(seconds=1)],
-                    y=[row[price_col], row[price_col]],
-                    mode="lines",
-                    name=price_col,
-                    line=dict(color=color, dash="dash"),
-                )
-            )
+def update_traces(fig: go.Figure, window: dict):
+    """就地更新固定 trace 的 x/y"""
+    ask, bid, entries, exits = fig.data
+    ask.update(x=window["x"], y=window["ask"])
+    bid.update(x=window["x"], y=window["bid"])
+    entries.update(x=window["entry"][0], y=window["entry"][1])
+    exits.update(x=window["exit"][0], y=window["exit"][1])
     return
 
 
-def create_interactive_view(trades: pd.DataFrame, ticks: pd.DataFrame, idx: int = 0):
+class TradeBrowser:
+    """What create_interactive_view does on each click, without widgets
+
+    Windows are cached per (idx, mode) and the neighbouring trades are
+    computed in the background; show() updates the fixed traces of fig in
+    place. Works on a plain go.Figure, so it can be driven headless.
+    """
+
+    def __init__(
+        self,
+        fig: go.Figure,
+        trades: pd.DataFrame,
+        ticks: pd.DataFrame,
+        cache_size: int = 256,
+    ):
+        self.fig = fig
+        self.trades = trades
+        self.ticks = ticks
+        self.trade_index = build_trade_index(trades)
+        self.window = lru_cache(maxsize=cache_size)(self._window)
+        # Compute neighbouring trades in the background while the user looks
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
+        self.prefetched: list[Future] = []
+        init_traces(fig)
+
+    def _window(self, idx: int, mode: str) -> dict:
+        return compute_window(self.trades, self.ticks, self.trade_index, idx, mode)
+
+    def show(self, idx: int, mode: str):
+        data = self.window(idx, mode)
+
+        with self.fig.batch_update():
+            update_traces(self.fig, data)
+            self.fig.update_layout(
+                title=f"USDJPY Trade Analysis: {idx}",
+                hovermode="x unified",
+                hoverdistance=100,
+                xaxis_title="Time" if mode == "Time" else "Tick Index",
+                xaxis_type="date" if mode == "Time" else "linear",
+                yaxis_title="Price",
+            )
+
+        self.prefetched = [
+            self.prefetcher.submit(self.window, neighbour, mode)
+            for neighbour in [idx + 1, idx - 1]
+            if 0 <= neighbour < len(self.trades)
+        ]
+
+
+def create_interactive_view(
+    trades: pd.DataFrame, ticks: pd.DataFrame, idx: int = 0, cache_size: int = 256
+):
     """Create interactive Plotly widget for browsing trades"""
     i_input = widgets.IntText(description="i:", value=idx)
     button_prev = widgets.Button(description="<")
@@ -151,55 +456,17 @@ def create_interactive_view(trades: pd.DataFrame, ticks: pd.DataFrame, idx: int
     fig = make_subplots(rows=1, cols=1)
     fig_widget = go.FigureWidget(fig)
     fig_widget.update_layout(height=600)
+    browser = TradeBrowser(fig_widget, trades, ticks, cache_size)
 
     def update_plot(idx: int):
         i_input.value = idx
-        with fig_widget.batch_update():
-            fig_widget.data = []
-            trade = trades.iloc[idx]
-
-            if view_mode.value == "Time":
-                x = trade["End Time"]
-                start = x - pd.Timedelta(seconds=10)
-                end = x + pd.Timedelta(seconds=1)
-                tick_slice = ticks[start:end]
-
-                plot_tick_data(fig_widget, tick_slice)
-                plot_entry_exit(fig_widget, trades, start, end, is_exit=False)
-                plot_entry_exit(fig_widget, trades, start, end, is_exit=True)
-
-                x_title = "Time"
-                x_type = "date"
-            else:
-                tick_slice = get_pretrade_ticks(trade, ticks, lookback=100).reset_index(
-                    drop=True
-                )
-                plot_tick_data(fig_widget, tick_slice)
-
-                x_title = "Tick Index"
-                x_type = "linear"
-
-            fig_widget.update_layout(
-                title=f"USDJPY Trade Analysis: {idx}",
-                hovermode="x unified",
-                hoverdistance=100,
-                xaxis_title=x_title,
-                xaxis_type=x_type,
-                yaxis_title="Price",
-            )
-
-    last_update = {"time": 0}
-    throttle_delay = 0.2  # Prevent rapid clicking lag
+        browser.show(idx, view_mode.value)
 
-    def throttled_update(x: int):
-        current = time.time()
-        if current - last_update["time"] > throttle_delay:
-            new_idx = max(0, min(len(trades) - 1, i_input.value + x))
-            update_plot(new_idx)
-            last_update["time"] = current
+    def step(x: int):
+        update_plot(max(0, min(len(trades) - 1, i_input.value + x)))
 
-    button_prev.on_click(lambda _: throttled_update(-1))
-    button_next.on_click(lambda _: throttled_update(1))
+    button_prev.on_click(lambda _: step(-1))
+    button_next.on_click(lambda _: step(1))
     view_mode.observe(lambda _: update_plot(i_input.value), names="value")
 
     controls = widgets.HBox(
@@ -213,5 +480,251 @@ def create_interactive_view(trades: pd.DataFrame, ticks: pd.DataFrame, idx: int
     return
 
 
-trades, ticks = load_data()
-create_interactive_view(trades, ticks, idx=0)
+HTML_TEMPLATE = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<script type="text/javascript">$plotlyjs</script>
+<style>
+  body { font-family: sans-serif; margin: 0 16px; }
+  #controls { display: flex; gap: 8px; justify-content: center; margin: 12px 0; }
+  #controls input { width: 80px; }
+  #controls .active { font-weight: bold; }
+</style>
+</head>
+<body>
+<div id="controls">
+  <button id="mode-Time">Time</button>
+  <button id="mode-Tick">Tick</button>
+  <button id="prev">&lt;</button>
+  <label>i: <input id="idx" type="number" min="0" value="$idx"></label>
+  <button id="next">&gt;</button>
+</div>
+<div id="plot" style="height: 600px"></div>
+<script type="text/javascript">
+const DATA = $data;
+
+function decode(b64, Type) {
+  const bytes = Uint8Array.from(atob(b64), (c) => c.charCodeAt(0));
+  return new Type(bytes.buffer);
+}
+function prices(b64) {
+  return Array.from(decode(b64, Int32Array), (v) => v / DATA.scale);
+}
+function lowerBound(arr, value) {
+  let lo = 0, hi = arr.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (arr[mid] < value) lo = mid + 1; else hi = mid;
+  }
+  return lo;
+}
+
+const endTime = decode(DATA.end_time, Float64Array);
+const time = {
+  t: decode(DATA.time.t, Float64Array),
+  bid: prices(DATA.time.bid),
+  ask: prices(DATA.time.ask),
+  lo: decode(DATA.time.lo, Int32Array),
+  hi: decode(DATA.time.hi, Int32Array),
+};
+const tick = {
+  bid: prices(DATA.tick.bid),
+  ask: prices(DATA.tick.ask),
+  offsets: decode(DATA.tick.offsets, Int32Array),
+};
+const marks = {};
+for (const key of ["entry", "exit"]) {
+  marks[key] = { t: decode(DATA[key].t, Float64Array), p: prices(DATA[key].p) };
+}
+
+// 窗口內所有進入/退出點，合併成一條以 null 分隔的線段
+function segments(m, start, end) {
+  const x = [], y = [];
+  for (let i = lowerBound(m.t, start); i < lowerBound(m.t, end); i++) {
+    x.push(m.t[i], m.t[i] + 1000, null);
+    y.push(m.p[i], m.p[i], null);
+  }
+  return [x, y];
+}
+
+function computeWindow(idx, mode) {
+  if (mode === "Time") {
+    const lo = time.lo[idx], hi = time.hi[idx];
+    const start = endTime[idx] - 10000, end = endTime[idx] + 1000;
+    return {
+      x: Array.from(time.t.subarray(lo, hi)),
+      ask: time.ask.slice(lo, hi),
+      bid: time.bid.slice(lo, hi),
+      entry: segments(marks.entry, start, end),
+      exit: segments(marks.exit, start, end),
+    };
+  }
+  const lo = tick.offsets[idx], hi = tick.offsets[idx + 1];
+  return {
+    x: Array.from({ length: hi - lo }, (_, i) => i),
+    ask: tick.ask.slice(lo, hi),
+    bid: tick.bid.slice(lo, hi),
+    entry: [[], []],
+    exit: [[], []],
+  };
+}
+
+const input = document.getElementById("idx");
+let mode = "Tick";
+
+function updatePlot(idx) {
+  input.value = idx;
+  const w = computeWindow(idx, mode);
+  const traces = [
+    { x: w.x, y: w.ask, name: "Ask", mode: "lines",
+      line: { color: "green", shape: "hv" }, opacity: 0.2 },
+    { x: w.x, y: w.bid, name: "Bid", mode: "lines",
+      line: { color: "red", shape: "hv" } },
+    { x: w.entry[0], y: w.entry[1], name: "Price", mode: "lines",
+      line: { color: "gray", dash: "dash" } },
+    { x: w.exit[0], y: w.exit[1], name: "End Price", mode: "lines",
+      line: { color: "blue", dash: "dash" } },
+  ];
+  const layout = {
+    title: { text: DATA.title + ": " + idx },
+    hovermode: "x unified",
+    hoverdistance: 100,
+    xaxis: { title: { text: mode === "Time" ? "Time" : "Tick Index" },
+             type: mode === "Time" ? "date" : "linear" },
+    yaxis: { title: { text: "Price" } },
+  };
+  Plotly.react("plot", traces, layout);
+  for (const m of ["Time", "Tick"]) {
+    document.getElementById("mode-" + m).classList.toggle("active", m === mode);
+  }
+}
+
+function step(x) {
+  const idx = (parseInt(input.value) || 0) + x;
+  updatePlot(Math.max(0, Math.min(endTime.length - 1, idx)));
+}
+
+document.getElementById("prev").onclick = () => step(-1);
+document.getElementById("next").onclick = () => step(1);
+input.onchange = () => step(0);
+for (const m of ["Time", "Tick"]) {
+  document.getElementById("mode-" + m).onclick = () => { mode = m; step(0); };
+}
+document.addEventListener("keydown", (e) => {
+  if (e.target === input) return;
+  if (e.key === "ArrowLeft") step(-1);
+  if (e.key === "ArrowRight") step(1);
+});
+step(0);
+</script>
+</body>
+</html>
+""")
+
+
+def price_scale(*prices: np.ndarray, max_decimals: int = 6) -> int:
+    """最小的 10 的次方，使所有價格乘上後都是整數"""
+    values = np.concatenate(prices)
+    for decimals in range(max_decimals + 1):
+        scaled = values * 10**decimals
+        if np.allclose(scaled, np.round(scaled), rtol=0, atol=1e-6):
+            return 10**decimals
+    raise ValueError(f"價格超過 {max_decimals} 位小數")
+
+
+def pack(values: np.ndarray, dtype: str, scale: int = 1) -> str:
+    """陣列轉成 little-endian 位元組再 base64，給 JS 的 TypedArray 解碼"""
+    if scale != 1:
+        values = np.round(np.asarray(values) * scale)
+    return base64.b64encode(np.asarray(values, dtype=dtype).tobytes()).decode()
+
+
+def to_ms(times) -> np.ndarray:
+    """datetime64 轉成 epoch 毫秒（Plotly 日期軸直接吃數字）"""
+    micros = np.asarray(times, dtype="datetime64[us]").astype(np.int64)
+    return micros / 1e3
+
+
+def export_html(
+    trades: pd.DataFrame,
+    ticks: pd.DataFrame,
+    path: Path,
+    title: str = "USDJPY Trade Analysis",
+    idx: int = 0,
+) -> Path:
+    """所有交易的 Time / Tick 窗口預先算好，輸出成單一離線 HTML
+
+    Time 模式只存所有窗口聯集範圍內的 tick，每筆交易記錄它在其中的 [lo, hi)；
+    Tick 模式的窗口彼此獨立（進場匹配不同），直接串接並記錄起點。價格以整數
+    點數存成 Int32Array，進出場點在瀏覽器端用二分搜尋取窗口，切換交易不需要
+    Jupyter kernel。
+    """
+    trade_index = build_trade_index(trades)
+    times = ticks.index.to_numpy()
+
+    # Time 模式：和 compute_window 相同的 [End Time - 10s, End Time + 1s]
+    end_time = trades["End Time"].to_numpy()
+    lo = times.searchsorted(end_time - np.timedelta64(10, "s"), side="left")
+    hi = times.searchsorted(end_time + np.timedelta64(1, "s"), side="right")
+    depth = np.zeros(len(times) + 1, dtype=np.int64)
+    np.add.at(depth, lo, 1)
+    np.add.at(depth, hi, -1)
+    kept = np.flatnonzero(np.cumsum(depth)[:-1] > 0)
+    time_ticks = ticks.iloc[kept]
+
+    # Tick 模式：逐筆走 get_pretrade_ticks 的匹配邏輯
+    windows = [
+        compute_window(trades, ticks, trade_index, i, "Tick")
+        for i in range(len(trades))
+    ]
+    offsets = np.cumsum([0] + [len(w["x"]) for w in windows])
+    tick_bid = np.concatenate([w["bid"] for w in windows])
+    tick_ask = np.concatenate([w["ask"] for w in windows])
+
+    marks = {key: trade_index[key] for key in ["entry", "exit"]}
+    scale = price_scale(
+        tick_bid,
+        tick_ask,
+        time_ticks["bid"].to_numpy(),
+        time_ticks["ask"].to_numpy(),
+        *[prices.astype(float) for _, prices in marks.values()],
+    )
+
+    data = {
+        "title": title,
+        "scale": scale,
+        "end_time": pack(to_ms(end_time), "<f8"),
+        "time": {
+            "t": pack(to_ms(time_ticks.index), "<f8"),
+            "bid": pack(time_ticks["bid"], "<i4", scale),
+            "ask": pack(time_ticks["ask"], "<i4", scale),
+            "lo": pack(kept.searchsorted(lo), "<i4"),
+            "hi": pack(kept.searchsorted(hi), "<i4"),
+        },
+        "tick": {
+            "bid": pack(tick_bid, "<i4", scale),
+            "ask": pack(tick_ask, "<i4", scale),
+            "offsets": pack(offsets, "<i4"),
+        },
+        **{
+            key: {"t": pack(to_ms(t), "<f8"), "p": pack(p.astype(float), "<i4", scale)}
+            for key, (t, p) in marks.items()
+        },
+    }
+
+    path = Path(path)
+    path.write_text(
+        HTML_TEMPLATE.substitute(
+            title=title, idx=idx, plotlyjs=get_plotlyjs(), data=json.dumps(data)
+        ),
+        encoding="utf-8",
+    )
+    print(f"已輸出 {len(trades)} 筆交易到 {path}（{path.stat().st_size / 1e6:.1f} MB）")
+    return path
+
+
+if __name__ == "__main__":
+    trades, ticks = load_data()
+    create_interactive_view(trades, ticks, idx=0)